@@ -0,0 +1,363 @@
+# Benchmarks of the editor on generated conversations. It drives the real Tk editor through its
+# methods and generated Tk events, so it needs a display: without one it starts Xvfb itself (or
+# run it under xvfb-run).
+#
+#   python conv_bench.py generate -n 20000 big.json
+#   python conv_bench.py run -n 20000 --output results.json
+#   python conv_bench.py run -n 20000 --baseline baseline.json    (exit status 1 on a regression)
+#   python conv_bench.py compare baseline.json results.json
+#
+# Every scenario runs --repeat times on the same editor, in this order: load, draw, zoom, drag,
+# rename, delete, panel, save and save_edit. Results are JSON: the timings of every run in
+# seconds, their median and minimum, and what was measured (generator settings, versions).
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from conv_graph import ROOT_NODE_ID, BASE_NODE_WIDTH, BASE_NODE_HEIGHT, LAYOUT_H_SPACING, LAYOUT_V_SPACING
+
+BENCH_FORMAT = "conv-bench"
+BENCH_THRESHOLD = 0.15  # Slower than the baseline median by more than this is a regression...
+BENCH_MIN_DELTA = 0.002 # ...if it is also this many seconds slower (timer noise)
+BENCH_TIMEOUT = 600     # Seconds a load or save may take
+BENCH_WINDOW = "1400x900"
+BENCH_DRAG_EVENTS = 100
+
+# --- Generator ---
+WORDS = ("coffee latte espresso cappuccino madam cup sugar milk foam bean roast grinder counter "
+         "order price secret code cake croissant window rain morning evening friend stranger story "
+         "question answer maybe never always today tomorrow sorry thanks please hello goodbye").split()
+SPRITES = ("images/madam.png", "images/madam_happy.png", "images/madam_upset.png", "images/madam_conspiratorial.png")
+SIDE_ACTIONS = ("save_espresso", "save_latte", "save_cappuccino", "clear_inventory", "website")
+
+def generate_conversation(nodes=1000, choices=(1, 4), secrets=(1, 3), entry_share=0.1, cycle_share=0.1,
+                          text_length=80, seed=0, positions=True):
+    # A conversation.json-shaped graph. Most links lead a few nodes further on (the story moves
+    # forward), cycle_share of them back to an earlier node; entry_share of the nodes ask for
+    # typed input. Some choices end the conversation or run an action. With positions the
+    # nodes sit on a grid in story order, like after a layered layout.
+    rng = random.Random(seed)
+    ids = [ROOT_NODE_ID] + [f"{rng.choice(WORDS)}_{i}" for i in range(1, nodes)]
+    row = max(1, math.ceil(math.sqrt(nodes)))
+
+    def text(length):
+        words = []
+        while sum(len(word) + 1 for word in words) < length: words.append(rng.choice(WORDS))
+        return " ".join(words).capitalize()
+
+    def link(i):
+        if i == nodes - 1 or rng.random() < cycle_share: return ids[rng.randrange(i + 1)]
+        return ids[min(nodes - 1, i + 1 + int(rng.expovariate(1 / 8)))]
+
+    data = {}
+    for i, node_id in enumerate(ids):
+        node = {"sprite_text": text(text_length)}
+        if rng.random() < 0.3: node["sprite_image"] = rng.choice(SPRITES)
+        if i and rng.random() < entry_share:
+            node["entry_mode"] = {
+                "prompt_text": text(20),
+                "secrets": [{"input": rng.choice(WORDS), "next_node_id": link(i)} for _ in range(rng.randint(*secrets))],
+                "default_next_node_id": link(i)}
+        else:
+            node["choices"] = []
+            for _ in range(rng.randint(*choices)):
+                choice = {"text": text(max(4, text_length // 4))}
+                if rng.random() < 0.05:
+                    choice["action"] = "end_conversation"
+                else:
+                    choice["next_node_id"] = link(i)
+                    if rng.random() < 0.05: choice["action"] = rng.choice(SIDE_ACTIONS)
+                node["choices"].append(choice)
+        if positions:
+            node["editor_pos"] = [50 + (i % row) * LAYOUT_H_SPACING, 50 + (i // row) * LAYOUT_V_SPACING]
+        data[node_id] = node
+    return data
+
+def generator_options(args):
+    return {'nodes': args.nodes, 'choices': list(args.choices), 'secrets': list(args.secrets),
+            'entry_share': args.entry_share, 'cycle_share': args.cycle_share,
+            'text_length': args.text_length, 'seed': args.seed, 'positions': not args.no_positions}
+
+# --- Display ---
+def ensure_display():
+    # Starts Xvfb when there is no X display, returns its process (None if there was a display)
+    if sys.platform in ("win32", "darwin") or os.environ.get("DISPLAY"): return None
+    xvfb = shutil.which("Xvfb")
+    if xvfb is None:
+        sys.exit("No display: install Xvfb or run the benchmarks under xvfb-run")
+    display = 99
+    while os.path.exists(f"/tmp/.X{display}-lock"): display += 1
+    process = subprocess.Popen([xvfb, f":{display}", "-screen", "0", "1600x1000x24", "-nolisten", "tcp"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while not os.path.exists(f"/tmp/.X11-unix/X{display}"):
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            sys.exit(f"Xvfb did not start on :{display}")
+        time.sleep(0.05)
+    os.environ["DISPLAY"] = f":{display}"
+    return process
+
+# --- Scenarios ---
+# Each one gets the editor and the bench state and returns the seconds of one run, setup and
+# background work it starts are left out.
+def pump(root, done, timeout=BENCH_TIMEOUT):
+    # Runs the Tk event loop until done() (the editor works in after() steps)
+    deadline = time.monotonic() + timeout
+    while not done():
+        if time.monotonic() > deadline: raise RuntimeError("timed out waiting for the editor")
+        root.update()
+        time.sleep(0.001)
+
+def settle(app, root):
+    # Lets the background work a change started (checks, search index, layout) finish
+    pump(root, lambda: not app.background_jobs())
+    root.update()
+
+def screen_point(app, node_id):
+    # Where the middle of a node is, in canvas widget coordinates
+    x, y = app.nodes.pos(node_id)
+    return (round((x + BASE_NODE_WIDTH / 2) * app.zoom_level - app.canvas.canvasx(0)),
+            round((y + BASE_NODE_HEIGHT / 2) * app.zoom_level - app.canvas.canvasy(0)))
+
+def visible_node(app):
+    nodes = sorted(app.materialized_nodes) or sorted(app.nodes)
+    return nodes[len(nodes) // 2]
+
+def bench_load(app, root, bench):
+    start = time.perf_counter()
+    app.start_loading(bench['path'])
+    pump(root, lambda: "load" not in app.background_jobs())
+    elapsed = time.perf_counter() - start
+    settle(app, root)
+    return elapsed
+
+def bench_draw(app, root, bench):
+    start = time.perf_counter()
+    app.draw_all_nodes_and_connections()
+    root.update_idletasks()
+    elapsed = time.perf_counter() - start
+    settle(app, root)
+    return elapsed
+
+def bench_zoom(app, root, bench):
+    # One zoom step around the middle of the view, in and out in turns so the zoom level stays put
+    bench['zoom_in'] = not bench.get('zoom_in', False)
+    start = time.perf_counter()
+    app.zoom(1.2 if bench['zoom_in'] else 1 / 1.2)
+    root.update_idletasks()
+    return time.perf_counter() - start
+
+def bench_drag(app, root, bench):
+    node_id = visible_node(app)
+    x, y = screen_point(app, node_id)
+    start = time.perf_counter()
+    app.canvas.event_generate("<ButtonPress-1>", x=x, y=y) # Handled right away, through the bindings
+    for i in range(1, BENCH_DRAG_EVENTS + 1):
+        app.canvas.event_generate("<B1-Motion>", x=x + 3 * i, y=y + 2 * i)
+        root.update() # Motion is applied once per frame from an after() job
+    app.canvas.event_generate("<ButtonRelease-1>", x=x + 3 * BENCH_DRAG_EVENTS, y=y + 2 * BENCH_DRAG_EVENTS)
+    root.update_idletasks()
+    elapsed = time.perf_counter() - start
+    settle(app, root)
+    return elapsed
+
+def most_linked(app):
+    return max(app.graph.ref_index, key=lambda node_id: (len(app.graph.ref_index[node_id]), node_id))
+
+def bench_rename(app, root, bench):
+    # The node most links point to, every link to it is rewritten
+    old_id = most_linked(app)
+    new_id = f"{old_id}_renamed"
+    start = time.perf_counter()
+    app.rename_node(old_id, new_id)
+    root.update_idletasks()
+    elapsed = time.perf_counter() - start
+    settle(app, root)
+    return elapsed
+
+def bench_delete(app, root, bench):
+    node_id = most_linked(app)
+    start = time.perf_counter()
+    app.remove_node(node_id) # What delete_node does once the user confirmed
+    app.deselect_node()
+    root.update_idletasks()
+    elapsed = time.perf_counter() - start
+    settle(app, root)
+    return elapsed
+
+def bench_panel(app, root, bench):
+    # Rebuilds the properties panel, for the nodes with the most choices in turns
+    if 'panel_nodes' not in bench:
+        bench['panel_nodes'] = sorted(app.conversation_data, key=lambda node_id: -len(app.conversation_data[node_id].get("choices", [])))[:2]
+    bench['panel_nodes'].reverse()
+    node_id = bench['panel_nodes'][0]
+    start = time.perf_counter()
+    app.build_properties_panel(node_id)
+    root.update_idletasks()
+    return time.perf_counter() - start
+
+def bench_save(app, root, bench):
+    # Every node serialized again, like the first save of a session
+    app.forget_all_node_json()
+    start = time.perf_counter()
+    app.save_json_data(bench['save_path'])
+    pump(root, lambda: "save" not in app.background_jobs())
+    return time.perf_counter() - start
+
+def bench_save_edit(app, root, bench):
+    # Save after editing one node, the other nodes come from the cache
+    node_id = visible_node(app)
+    app.update_node_property(None, node_id, "sprite_text", f"Edited {time.perf_counter()}")
+    settle(app, root)
+    start = time.perf_counter()
+    app.save_json_data(bench['save_path'])
+    pump(root, lambda: "save" not in app.background_jobs())
+    return time.perf_counter() - start
+
+SCENARIOS = {"load": bench_load, "draw": bench_draw, "zoom": bench_zoom, "drag": bench_drag,
+             "rename": bench_rename, "delete": bench_delete, "panel": bench_panel,
+             "save": bench_save, "save_edit": bench_save_edit}
+
+def run_benchmarks(options, scenarios, repeat, progress=print):
+    # Generates the conversation, opens the editor on it and times the scenarios. Returns the
+    # results document (see the top of the file).
+    import tkinter as tk
+    import conv_edit
+    with tempfile.TemporaryDirectory(prefix="conv_bench.") as folder:
+        path = os.path.join(folder, "conversation.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(generate_conversation(**options), f, indent=2, ensure_ascii=False)
+        bench = {'path': path, 'save_path': os.path.join(folder, "saved.json")}
+        root = tk.Tk()
+        root.geometry(BENCH_WINDOW)
+        app = conv_edit.ConversationEditorApp(root)
+        root.update()
+        if "load" not in scenarios: bench_load(app, root, bench) # The others need the graph
+        results = {}
+        try:
+            for name in scenarios:
+                samples = [SCENARIOS[name](app, root, bench) for _ in range(repeat)]
+                results[name] = {'samples': samples, 'median': statistics.median(samples), 'min': min(samples)}
+                progress(f"{name:10} median {results[name]['median'] * 1000:9.1f} ms   min {results[name]['min'] * 1000:9.1f} ms")
+        finally:
+            app.close_journal()
+            root.destroy()
+    return {'format': BENCH_FORMAT, 'generator': options, 'repeat': repeat, 'results': results,
+            'environment': bench_environment(tk.TkVersion)}
+
+def bench_environment(tk_version):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {'python': platform.python_version(), 'tk': tk_version, 'platform': platform.platform(),
+            'machine': platform.machine(), 'commit': commit, 'time': time.strftime("%Y-%m-%d %H:%M:%S")}
+
+# --- Comparison ---
+def compare_results(baseline, results, threshold=BENCH_THRESHOLD):
+    # Rows (scenario, baseline median, new median, status), status is "regression",
+    # "improvement", "same" or "new"
+    rows = []
+    for name, result in results['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            rows.append((name, None, result['median'], "new"))
+            continue
+        delta = result['median'] - before['median']
+        if delta > before['median'] * threshold and delta > BENCH_MIN_DELTA: status = "regression"
+        elif -delta > before['median'] * threshold and -delta > BENCH_MIN_DELTA: status = "improvement"
+        else: status = "same"
+        rows.append((name, before['median'], result['median'], status))
+    return rows
+
+def print_comparison(baseline, results, threshold):
+    # Returns True when something got slower
+    if baseline.get('generator') != results.get('generator'):
+        print("warning: the baseline was measured on a different generated conversation")
+    for name, before, after, status in compare_results(baseline, results, threshold):
+        if before is None:
+            print(f"{name:10} {'':>10}    {after * 1000:9.1f} ms   new")
+        else:
+            change = (after - before) / before * 100 if before else 0.0
+            print(f"{name:10} {before * 1000:9.1f} -> {after * 1000:9.1f} ms  {change:+6.1f}%  {status.upper() if status == 'regression' else status}")
+    return any(row[3] == "regression" for row in compare_results(baseline, results, threshold))
+
+def read_results(path):
+    with open(path, encoding="utf-8") as f:
+        results = json.load(f)
+    if results.get('format') != BENCH_FORMAT: raise ValueError(f"{path} is not a benchmark result file")
+    return results
+
+# --- Command line ---
+def add_generator_arguments(parser):
+    parser.add_argument("-n", "--nodes", type=int, default=5000, help="nodes to generate (default: 5000)")
+    parser.add_argument("--choices", type=int, nargs=2, default=(1, 4), metavar=("MIN", "MAX"), help="choices per node (default: 1 4)")
+    parser.add_argument("--secrets", type=int, nargs=2, default=(1, 3), metavar=("MIN", "MAX"), help="secrets per entry node (default: 1 3)")
+    parser.add_argument("--entry-share", type=float, default=0.1, help="share of nodes with entry_mode (default: 0.1)")
+    parser.add_argument("--cycle-share", type=float, default=0.1, help="share of links going back to an earlier node (default: 0.1)")
+    parser.add_argument("--text-length", type=int, default=80, help="characters of sprite_text (default: 80)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument("--no-positions", action="store_true", help="leave editor_pos out, the editor lays the nodes out on load")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the conversation editor on generated conversations.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="write a generated conversation file")
+    add_generator_arguments(generate)
+    generate.add_argument("output", help="file to write")
+    run = commands.add_parser("run", help="time the editor scenarios")
+    add_generator_arguments(run)
+    run.add_argument("--repeat", type=int, default=5, help="runs of every scenario (default: 5)")
+    run.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS), metavar="NAME",
+                     help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    run.add_argument("-o", "--output", help="write the results to this JSON file")
+    run.add_argument("--baseline", help="results to compare with, exit status 1 on a regression")
+    run.add_argument("--threshold", type=float, default=BENCH_THRESHOLD, help=f"slowdown that counts as a regression (default: {BENCH_THRESHOLD})")
+    compare = commands.add_parser("compare", help="compare two result files")
+    compare.add_argument("baseline")
+    compare.add_argument("results")
+    compare.add_argument("--threshold", type=float, default=BENCH_THRESHOLD, help=f"slowdown that counts as a regression (default: {BENCH_THRESHOLD})")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(generate_conversation(**generator_options(args)), f, indent=2, ensure_ascii=False)
+        print(f"Wrote {args.nodes} nodes to {args.output}")
+        return 0
+    if args.command == "compare":
+        try:
+            baseline, results = read_results(args.baseline), read_results(args.results)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        return 1 if print_comparison(baseline, results, args.threshold) else 0
+
+    if args.repeat < 1: parser.error("--repeat must be at least 1")
+    try:
+        baseline = read_results(args.baseline) if args.baseline else None
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    xvfb = ensure_display()
+    try:
+        results = run_benchmarks(generator_options(args), args.scenarios, args.repeat)
+    finally:
+        if xvfb is not None: xvfb.terminate()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if baseline is not None:
+        return 1 if print_comparison(baseline, results, args.threshold) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
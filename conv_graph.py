@@ -0,0 +1,1974 @@
+# Conversation graph model without any UI: the node data, the links between nodes, loading,
+# saving, the change journal and automatic layout. conv_edit.py builds the editor on top of it,
+# and it runs on its own as a command-line tool for build pipelines:
+#
+#   python conv_graph.py validate conversation.json dialogues/
+#   python conv_graph.py rename --map old_id=new_id conversation.json
+#   python conv_graph.py rename --regex '^intro_(.*)' 'prologue_\\1' dialogues/
+#   python conv_graph.py prune --dry-run conversation.json
+#   python conv_graph.py layout --mode force --all conversation.json
+#   python conv_graph.py bundle --chunk-size 200 conversation.json
+#   python conv_graph.py search -q 'action == kill' dialogues/
+#   python conv_graph.py simulate --walks 1000000 conversation.json
+#   python conv_graph.py convert conversation.json            (writes conversation.convdb)
+#   python conv_graph.py convert -o conversation.json conversation.convdb
+#
+# Every command reads projects (.convdb, see ProjectStore) as well as JSON. Directories are
+# searched for both, several files are processed in parallel.
+import argparse
+import bisect
+import copy
+import gzip
+import heapq
+import json
+import marshal
+import os
+import math
+import multiprocessing
+import re
+import shlex
+import sqlite3
+import sys
+import threading
+import tempfile
+import random
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+
+# WORLD size of a node in the editor, layouts keep nodes this far apart
+BASE_NODE_WIDTH = 180
+BASE_NODE_HEIGHT = 100
+
+ROOT_NODE_ID = "start" # Where js/main.js starts the conversation
+
+# --- Node data ---
+def iter_node_links(node_data):
+    # Yields (key_path, target_id) for every outgoing link of a node, in the same
+    # order the connections have always been drawn: choices, secrets, then default.
+    for i, choice in enumerate(node_data.get("choices", [])):
+        if choice.get("next_node_id"): yield f"choices.{i}.next_node_id", choice["next_node_id"]
+    entry_mode = node_data.get("entry_mode")
+    if entry_mode:
+        for i, secret in enumerate(entry_mode.get("secrets", [])):
+            if secret.get("next_node_id"): yield f"entry_mode.secrets.{i}.next_node_id", secret["next_node_id"]
+        if entry_mode.get("default_next_node_id"):
+            yield "entry_mode.default_next_node_id", entry_mode["default_next_node_id"]
+
+def get_path_value(node_data, key_path):
+    # Reads a property path like "choices.0.text", "" when any part of it is missing
+    val = node_data
+    try:
+        for key in key_path.split('.'):
+            if isinstance(val, list) and key.isdigit(): # Handle list indices like choices.0.text
+                val = val[int(key)]
+            else:
+                val = val[key]
+        return val if val is not None else ""
+    except (KeyError, TypeError, IndexError): return ""
+
+def set_path_value(node_data, key_path, value):
+    # Writes a property path like "choices.0.text" the way the properties panel does: empty
+    # optional fields are removed. Returns False if the path does not fit the node.
+    keys = key_path.split('.')
+    data_ptr = node_data
+    
+    for i, key_segment in enumerate(keys[:-1]):
+        if key_segment.isdigit(): # Array index for choices or secrets
+            idx = int(key_segment)
+            # Ensure list exists and is long enough
+            # This part needs to be careful not to create unwanted structures if path is wrong
+            if not isinstance(data_ptr, list) or idx >= len(data_ptr) :
+                # This indicates an issue or a need to create the list/item
+                # For simplicity, assume lists (choices/secrets) are created by "Add" buttons
+                print(f"Warning: Path segment '{key_segment}' for index {idx} in '{key_path}' implies list, but context is: {type(data_ptr)}")
+                # Potentially try to fix it if next key is not an index.
+                # If the path implies a list (e.g. choices.0) but 'choices' isn't a list, we have a problem.
+                # This function assumes the structure mostly exists, especially lists.
+                if not isinstance(data_ptr, dict) or key_segment not in data_ptr: # Create if missing and next is dict key
+                     if i + 1 < len(keys) and not keys[i+1].isdigit():
+                        data_ptr[key_segment] = {}
+                     else: # If next is digit, this is likely a wrong path for an array.
+                        print(f"Error: Trying to access/create index in non-list or missing list for {key_path}")
+                        return False # Avoid further errors
+                
+            if isinstance(data_ptr, dict) and key_segment in data_ptr:
+                data_ptr = data_ptr[key_segment]
+            elif isinstance(data_ptr, list) and idx < len(data_ptr):
+                data_ptr = data_ptr[idx]
+            else:
+                # Error or create structure. Let's log error and return to avoid breaking.
+                print(f"Error: Cannot navigate path '{key_path}' at segment '{key_segment}'")
+                return False
+
+        else: # Object key
+            if key_segment not in data_ptr or not isinstance(data_ptr[key_segment], (dict, list)):
+                 # If next segment is an index, create a list, else a dict
+                if i + 1 < len(keys) and keys[i+1].isdigit():
+                    data_ptr[key_segment] = []
+                else:
+                    data_ptr[key_segment] = {}
+            data_ptr = data_ptr[key_segment]
+    
+    final_key = keys[-1]
+    is_list_final_key = final_key.isdigit()
+    if is_list_final_key: final_key = int(final_key)
+
+    optional_keys_for_deletion = ["sprite_image", "item", "action", "default_next_node_id", "prompt_text"]
+    is_optional_key = any(key_path.endswith(op_key) for op_key in optional_keys_for_deletion)
+
+    if value == "" and is_optional_key:
+        if isinstance(data_ptr, dict) and final_key in data_ptr:
+            del data_ptr[final_key]
+        elif isinstance(data_ptr, list) and isinstance(final_key, int) and final_key < len(data_ptr) :
+            # This would imply trying to "delete" a list item by emptying one of its string properties.
+            # Usually, we remove list items via a "Remove" button, not by emptying a field.
+            # So, if it's an optional string field within a list item, set it to empty.
+             data_ptr[final_key] = value # Or del data_ptr[final_key] if that specific property should be removed
+    else:
+        if isinstance(data_ptr, list) and isinstance(final_key, int):
+            if final_key < len(data_ptr): data_ptr[final_key] = value
+            # else: print("Error: list index out of bounds for", key_path) # Should be handled by Add buttons
+        elif isinstance(data_ptr, dict):
+            data_ptr[final_key] = value
+        else:
+            print(f"Error: Cannot set property. data_ptr is not dict or list for final_key of {key_path}")
+    return True
+
+def set_link_value(node_data, key_path, value):
+    # Writes a link found by iter_node_links, e.g. "choices.2.next_node_id"
+    keys = key_path.split('.')
+    data_ptr = node_data
+    for key in keys[:-1]:
+        data_ptr = data_ptr[int(key)] if key.isdigit() else data_ptr[key]
+    data_ptr[keys[-1]] = value
+
+def copy_subgraph(nodes, taken):
+    # Copies of nodes ({id: data}) for pasting into a graph whose ids are taken: an id that is
+    # taken becomes "<id>_copy", "<id>_copy2"... Links between the copied nodes follow them to
+    # their new ids, links to other nodes stay. Returns {new id: data}, in the order of nodes.
+    mapping = {}
+    for node_id in nodes:
+        new_id, n = node_id, 1
+        while new_id in taken or new_id in mapping.values():
+            new_id = f"{node_id}_copy" if n == 1 else f"{node_id}_copy{n}"
+            n += 1
+        mapping[node_id] = new_id
+    copies = {}
+    for node_id, node_data in nodes.items():
+        node_data = copy.deepcopy(node_data)
+        for key_path, target_id in list(iter_node_links(node_data)):
+            if target_id in mapping: set_link_value(node_data, key_path, mapping[target_id])
+        copies[mapping[node_id]] = node_data
+    return copies
+
+# --- Loading ---
+# Files are read and parsed in one pass that reports through post(message), so the editor can
+# run it on a worker thread and take the parsed nodes in small steps on the UI thread.
+LOAD_READ_CHUNK = 1 << 20   # Bytes per read
+LOAD_BATCH_NODES = 500      # Parsed nodes per message to the UI thread
+_JSON_WS = re.compile(r'[ \t\n\r]*')
+
+class LoadCancelled(Exception):
+    pass
+
+def node_format_error(node_id, node_data):
+    # Checks the structure the editor relies on, returns an error message or None
+    if not isinstance(node_data, dict): return f"Node '{node_id}' is not an object"
+    choices = node_data.get("choices", [])
+    if not isinstance(choices, list) or not all(isinstance(c, dict) for c in choices):
+        return f"Node '{node_id}': 'choices' must be a list of objects"
+    entry_mode = node_data.get("entry_mode")
+    if entry_mode is not None:
+        if not isinstance(entry_mode, dict): return f"Node '{node_id}': 'entry_mode' must be an object"
+        secrets = entry_mode.get("secrets", [])
+        if not isinstance(secrets, list) or not all(isinstance(sec, dict) for sec in secrets):
+            return f"Node '{node_id}': 'entry_mode.secrets' must be a list of objects"
+    try:
+        for key_path, target_id in iter_node_links(node_data):
+            if not isinstance(target_id, str): return f"Node '{node_id}': '{key_path}' must be a string"
+    except AttributeError:
+        return f"Node '{node_id}' has a malformed link"
+    return None
+
+def iter_json_object(text):
+    # Yields (key, value, end position) for each member of the top-level JSON object, one at
+    # a time. Each value is decoded on its own so the caller can report progress and stop early.
+    decoder = json.JSONDecoder()
+    pos = _JSON_WS.match(text, 0).end()
+    if text[pos:pos+1] != '{': raise ValueError("The file does not contain a JSON object")
+    pos = _JSON_WS.match(text, pos + 1).end()
+    if text[pos:pos+1] == '}':
+        pos += 1
+    else:
+        while True:
+            if text[pos:pos+1] != '"': raise ValueError(f"Expected a node id at character {pos}")
+            key, pos = decoder.raw_decode(text, pos)
+            pos = _JSON_WS.match(text, pos).end()
+            if text[pos:pos+1] != ':': raise ValueError(f"Expected ':' at character {pos}")
+            pos = _JSON_WS.match(text, pos + 1).end()
+            value, pos = decoder.raw_decode(text, pos)
+            yield key, value, pos
+            pos = _JSON_WS.match(text, pos).end()
+            if text[pos:pos+1] == '}':
+                pos += 1
+                break
+            if text[pos:pos+1] != ',': raise ValueError(f"Expected ',' or '}}' at character {pos}")
+            pos = _JSON_WS.match(text, pos + 1).end()
+    if _JSON_WS.match(text, pos).end() != len(text): raise ValueError(f"Extra data at character {pos}")
+
+def parse_conversation_file(path, post, cancel_event):
+    # Worker thread: reads, parses and validates a conversation file. Talks to the UI thread
+    # only through post(message): ("progress", fraction, text), ("nodes", [(id, data), ...]),
+    # ("done", node_count) or ("error", text).
+    try:
+        total = os.path.getsize(path) or 1
+        chunks = []
+        read = 0
+        with open(path, 'rb') as f:
+            while True:
+                if cancel_event.is_set(): raise LoadCancelled()
+                chunk = f.read(LOAD_READ_CHUNK)
+                if not chunk: break
+                chunks.append(chunk)
+                read += len(chunk)
+                post(("progress", 0.2 * read / total, "Reading file..."))
+        text = b"".join(chunks).decode('utf-8')
+        chunks = None
+
+        batch = []
+        count = 0
+        for node_id, node_data, pos in iter_json_object(text):
+            if cancel_event.is_set(): raise LoadCancelled()
+            error = node_format_error(node_id, node_data)
+            if error: raise ValueError(error)
+            batch.append((node_id, node_data))
+            count += 1
+            if len(batch) >= LOAD_BATCH_NODES:
+                post(("nodes", batch))
+                post(("progress", 0.2 + 0.65 * pos / len(text), f"Parsing... {count} nodes"))
+                batch = []
+        if batch: post(("nodes", batch))
+        post(("done", count))
+    except LoadCancelled:
+        pass
+    except Exception as e:
+        post(("error", str(e)))
+
+# --- Saving ---
+# Each node is serialized on its own and the text is cached until the node is edited, so a
+# save only re-encodes the dirty nodes. Writing happens on a worker thread into a temporary
+# file that then replaces the target, a crash mid-save leaves the old file intact.
+def node_json_fragment(node_data, compact):
+    # Text of one node as it appears inside the top-level object
+    if compact: return json.dumps(node_data, ensure_ascii=False, separators=(',', ':'))
+    return json.dumps(node_data, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+
+def write_conversation_file(path, nodes, encoded, compact, post):
+    # Worker thread. Writes nodes, a list of (id, text or data) the caller can not change: the
+    # cached fragment of a node, or its data (possibly marshalled) which is encoded and stored in
+    # encoded, a dict of the worker's own (the caller merges it into its cache once it is done).
+    # Same output as json.dump(indent=2) (or compact). Reports ("done", None) or ("error", text)
+    # through post(message).
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            separator = "," if compact else ",\n  "
+            f.write("{" if compact else "{\n  ")
+            written = 0
+            for node_id, fragment in nodes:
+                if not isinstance(fragment, str):
+                    fragment = node_json_fragment(marshal.loads(fragment) if isinstance(fragment, bytes) else fragment, compact)
+                    encoded[node_id] = fragment
+                if written: f.write(separator)
+                f.write(json.dumps(node_id, ensure_ascii=False) + (":" if compact else ": ") + fragment)
+                written += 1
+            if written:
+                f.write("}" if compact else "\n}")
+            else:
+                f.seek(0)
+                f.truncate()
+                f.write("{}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644)
+        os.replace(tmp_path, path)
+        post(("done", None))
+    except Exception as e:
+        if tmp_path and os.path.exists(tmp_path): os.remove(tmp_path)
+        post(("error", str(e)))
+
+# --- Journal ---
+# Every edit is appended to <file>.journal as one JSON line, so unsaved work survives a crash.
+# The first line describes the main file the records apply to. When the journal grows too big
+# the editor saves the main file and restarts the journal with rebase().
+JOURNAL_SUFFIX = ".journal"
+
+def journal_base_record(base_path):
+    st = os.stat(base_path)
+    return {"op": "base", "file": os.path.basename(base_path), "size": st.st_size, "mtime": st.st_mtime}
+
+def journal_lines(path):
+    # Yields (record, offset after its line) up to the first line that does not parse, which is
+    # a torn last line when the editor crashed while writing
+    offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b"\n"): break
+            try:
+                record = json.loads(line.decode('utf-8'))
+            except ValueError:
+                break
+            offset += len(line)
+            yield record, offset
+
+def journal_payload(records):
+    return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode('utf-8')
+
+def read_journal(path):
+    # Returns (base record or None, [change records]). A torn last line is dropped.
+    base, records = None, []
+    for record, _ in journal_lines(path):
+        if record.get("op") == "base": base = record
+        else: records.append(record)
+    return base, records
+
+def apply_journal_record(data, record):
+    # Replays one change record on conversation data. Records hold absolute values, so
+    # applying one that the main file already contains does no harm.
+    op, node_id = record.get("op"), record.get("node")
+    if op == "set":
+        if node_id in data: set_path_value(data[node_id], record["path"], record["value"])
+    elif op == "move":
+        if node_id in data: data[node_id]["editor_pos"] = tuple(record["pos"])
+    elif op in ("add", "node"):
+        data[node_id] = record["data"]
+    elif op in ("delete", "rename"):
+        new_id = record.get("to", "") # Links to a deleted node are cleared
+        if op == "rename":
+            if node_id not in data or new_id in data: return
+            data[new_id] = data.pop(node_id)
+        else:
+            data.pop(node_id, None)
+        for node_data in data.values():
+            for key_path, target_id in list(iter_node_links(node_data)):
+                if target_id == node_id: set_link_value(node_data, key_path, new_id)
+
+class ChangeJournal:
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.path = base_path + JOURNAL_SUFFIX
+        self.file = None
+
+    def open(self):
+        # Appends to the journal left from an earlier session, or starts a new one. A torn last
+        # line is cut off first: the next record would be glued to it and lost with it.
+        end = 0
+        if os.path.exists(self.path):
+            for _, end in journal_lines(self.path): pass
+        self.file = open(self.path, 'ab')
+        self.file.truncate(end)
+        self.file.seek(0, os.SEEK_END)
+        if end == 0: self.append(journal_base_record(self.base_path))
+
+    def append(self, record):
+        self.append_many([record])
+
+    def append_many(self, records):
+        self.file.write(journal_payload(records))
+        self.file.flush()
+
+    def size(self):
+        return self.file.tell()
+
+    def rebase(self, offset, base_path):
+        # base_path now holds everything recorded before offset: restart the journal next to
+        # it with only the later records (edits made while the save was running)
+        self.file.close()
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            tail = f.read()
+        if base_path != self.base_path: # Saved under another name, the journal follows the file
+            os.remove(self.path)
+            self.base_path = base_path
+            self.path = base_path + JOURNAL_SUFFIX
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(journal_payload([journal_base_record(base_path)]))
+            f.write(tail)
+        os.replace(tmp_path, self.path)
+        self.file = open(self.path, 'ab')
+
+    def reset(self, records):
+        # Restarts the journal with a base record of the main file as it is now, followed by
+        # records (replayed ones: in the editor's data but still not in the file)
+        self.close()
+        write_file_atomic(self.path, journal_payload([journal_base_record(self.base_path)] + list(records)))
+
+    def records_since(self, offset):
+        # Change records appended after offset (a size() taken earlier)
+        records = []
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    records.append(json.loads(line.decode('utf-8')))
+                except ValueError:
+                    break
+        return records
+
+    def close(self):
+        if self.file is not None: self.file.close()
+        self.file = None
+
+# --- Projects ---
+# A project is an SQLite file holding one row per node: its JSON, its editor position in
+# indexed columns and, in the edges table indexed by target, its outgoing links. The editor
+# applies every change record to it in a transaction of its own (ProjectStore stands in for
+# the journal), so there is nothing left to write on save and nothing to replay after a crash.
+# Only the rows an edit touches are read: the node, and the nodes linking to it when it is
+# deleted or renamed. JSON stays the format js/main.js reads, see the convert command.
+# Opening a project still reads every node into the editor (parse_project_file only sends the
+# first view first): validation, search, the link index and the simulation work on the whole
+# graph in memory. Keeping only a window of nodes loaded is left for later.
+PROJECT_SUFFIX = ".convdb"
+PROJECT_VERSION = 1
+PROJECT_QUERY_IDS = 500 # Ids per "IN (...)" query, under SQLite's variable limit
+PROJECT_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE nodes (id TEXT PRIMARY KEY, data TEXT NOT NULL, x REAL, y REAL);
+CREATE INDEX nodes_position ON nodes (x, y);
+CREATE TABLE edges (source TEXT NOT NULL, path TEXT NOT NULL, target TEXT NOT NULL, PRIMARY KEY (source, path));
+CREATE INDEX edges_target ON edges (target);
+"""
+
+def is_project_file(path):
+    return path.endswith(PROJECT_SUFFIX)
+
+def open_project(path, create=False):
+    # Raises ValueError if the file is not a project (sqlite3.Error if it can not be read)
+    if not create and not os.path.isfile(path): raise OSError(f"No such file: {path}")
+    conn = sqlite3.connect(path)
+    try:
+        if create:
+            conn.executescript(PROJECT_SCHEMA)
+            conn.execute("INSERT INTO meta VALUES ('version', ?)", (str(PROJECT_VERSION),))
+            conn.commit()
+        else:
+            try:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            except sqlite3.DatabaseError:
+                row = None
+            if row is None: raise ValueError(f"{os.path.basename(path)} is not a conversation project")
+            if int(row[0]) > PROJECT_VERSION: raise ValueError(f"{os.path.basename(path)} was written by a newer editor")
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+def project_node_row(node_id, node_data):
+    pos = node_data.get("editor_pos")
+    x, y = (pos[0], pos[1]) if isinstance(pos, (list, tuple)) and len(pos) == 2 else (None, None)
+    return node_id, json.dumps(node_data, ensure_ascii=False, separators=(',', ':')), x, y
+
+def write_project_nodes(conn, nodes):
+    # Inserts or replaces (id, data) pairs and their edges, inside the caller's transaction
+    rows, edges = [], []
+    for node_id, node_data in nodes:
+        rows.append(project_node_row(node_id, node_data))
+        edges.extend((node_id, key_path, target_id) for key_path, target_id in iter_node_links(node_data))
+    conn.executemany("DELETE FROM edges WHERE source = ?", [(row[0],) for row in rows])
+    conn.executemany("INSERT INTO nodes VALUES (?, ?, ?, ?) ON CONFLICT (id) DO UPDATE " # Keeps the row (file order)
+                     "SET data = excluded.data, x = excluded.x, y = excluded.y", rows)
+    conn.executemany("INSERT OR REPLACE INTO edges VALUES (?, ?, ?)", edges)
+
+def read_project_nodes(conn, node_ids):
+    node_ids = list(node_ids)
+    nodes = {}
+    for i in range(0, len(node_ids), PROJECT_QUERY_IDS):
+        chunk = node_ids[i:i + PROJECT_QUERY_IDS]
+        query = f"SELECT id, data FROM nodes WHERE id IN ({','.join('?' * len(chunk))})"
+        nodes.update((node_id, json.loads(data)) for node_id, data in conn.execute(query, chunk))
+    return nodes
+
+def apply_project_record(conn, record):
+    # apply_journal_record on the rows the record touches, inside the caller's transaction
+    op, node_id = record.get("op"), record.get("node")
+    node_ids = {node_id}
+    if op in ("delete", "rename"):
+        node_ids.update(source for source, in conn.execute("SELECT source FROM edges WHERE target = ?", (node_id,)))
+        if op == "rename": node_ids.add(record.get("to", ""))
+    nodes = read_project_nodes(conn, node_ids)
+    apply_journal_record(nodes, record)
+    gone = [(removed_id,) for removed_id in node_ids - nodes.keys()]
+    conn.executemany("DELETE FROM nodes WHERE id = ?", gone)
+    conn.executemany("DELETE FROM edges WHERE source = ?", gone)
+    write_project_nodes(conn, nodes.items())
+
+def write_project_file(path, nodes, post):
+    # Worker thread. Writes nodes, a list of (id, data) the caller can not change (the data
+    # possibly marshalled), as a new project that then replaces path. Reports ("done", None) or
+    # ("error", text) through post(message) like write_conversation_file.
+    tmp_path = None
+    try:
+        nodes = ((node_id, marshal.loads(node_data) if isinstance(node_data, bytes) else node_data) for node_id, node_data in nodes)
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(path)))
+        os.close(fd)
+        os.remove(tmp_path) # SQLite creates it
+        conn = open_project(tmp_path, create=True)
+        try:
+            with conn:
+                write_project_nodes(conn, nodes)
+        finally:
+            conn.close()
+        for sidecar in ("-wal", "-shm"): # Left by an earlier session, they would be applied to the new file
+            if os.path.exists(path + sidecar): os.remove(path + sidecar)
+        os.replace(tmp_path, path)
+        post(("done", None))
+    except Exception as e:
+        if tmp_path and os.path.exists(tmp_path): os.remove(tmp_path)
+        post(("error", str(e)))
+
+def parse_project_file(path, post, cancel_event, view=None):
+    # Worker thread, same messages as parse_conversation_file. With view (width, height in
+    # WORLD units) the nodes the editor shows first, the top left corner of the graph, come
+    # first, found through the position index.
+    conn = None
+    try:
+        conn = open_project(path)
+        total = conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0] or 1
+        queries = [("SELECT id, data FROM nodes ORDER BY rowid", ())]
+        if view:
+            x, y = conn.execute("SELECT MIN(x), MIN(y) FROM nodes").fetchone()
+            if x is not None:
+                queries.insert(0, ("SELECT id, data FROM nodes WHERE x BETWEEN ? AND ? AND y BETWEEN ? AND ?",
+                                   (x - BASE_NODE_WIDTH, x + view[0], y - BASE_NODE_HEIGHT, y + view[1])))
+        sent = set()
+        batch = []
+        for query, parameters in queries:
+            for node_id, data in conn.execute(query, parameters):
+                if node_id in sent: continue
+                if cancel_event.is_set(): raise LoadCancelled()
+                node_data = json.loads(data)
+                error = node_format_error(node_id, node_data)
+                if error: raise ValueError(error)
+                sent.add(node_id)
+                batch.append((node_id, node_data))
+                if len(batch) >= LOAD_BATCH_NODES:
+                    post(("nodes", batch))
+                    post(("progress", 0.85 * len(sent) / total, f"Reading... {len(sent)} nodes"))
+                    batch = []
+        if batch: post(("nodes", batch))
+        post(("done", len(sent)))
+    except LoadCancelled:
+        pass
+    except Exception as e:
+        post(("error", str(e)))
+    finally:
+        if conn is not None: conn.close()
+
+class ProjectStore:
+    # The editor's journal for a project (same interface as ChangeJournal): append() commits a
+    # change record to the file right away, append_many() commits a batch in one transaction.
+    # The records since the last save are kept (the editor drops them when they pile up and no
+    # save is running): a save to another file is taken from a snapshot, and rebase() replays
+    # the later ones into it. size() counts these records.
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.conn = None
+        self.log = []
+
+    def open(self):
+        try:
+            self.conn = open_project(self.base_path)
+            self.conn.execute("PRAGMA journal_mode=WAL") # Small commits without rewriting pages twice
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        except (sqlite3.Error, ValueError) as e:
+            self.close()
+            raise OSError(str(e)) from e
+
+    def append(self, record):
+        self.append_many([record])
+
+    def append_many(self, records):
+        try:
+            with self.conn:
+                for record in records: apply_project_record(self.conn, record)
+        except sqlite3.Error as e:
+            raise OSError(str(e)) from e
+        self.log.extend(records)
+
+    def size(self):
+        return len(self.log)
+
+    def records_since(self, offset):
+        return self.log[offset:]
+
+    def rebase(self, offset, base_path):
+        later = self.log[offset:]
+        self.log = []
+        if base_path == self.base_path: return # Everything is in the file already
+        self.close()
+        self.base_path = base_path
+        self.open()
+        self.append_many(later)
+        self.log = []
+
+    def close(self):
+        if self.conn is not None: self.conn.close()
+        self.conn = None
+
+# --- Layout ---
+# Positions for nodes from their links. Both layouts run on a worker thread and work on plain
+# lists indexed by node number, the result is top-left WORLD positions starting at (0, 0).
+LAYOUT_H_SPACING = BASE_NODE_WIDTH + 60
+LAYOUT_V_SPACING = BASE_NODE_HEIGHT + 80
+LAYOUT_MAX_ROW = 40        # Wider layers wrap onto several rows
+LAYOUT_ORDER_SWEEPS = 4    # Barycenter passes (each one down and up) to reduce crossings
+BARNES_HUT_THETA = 0.8     # Cells seen under a smaller angle than this act as one body
+
+def layout_adjacency(node_ids, edges):
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+    outgoing = [[] for _ in node_ids]
+    incoming = [[] for _ in node_ids]
+    for source_id, targets in edges.items():
+        i = index.get(source_id)
+        if i is None: continue
+        for target_id in targets:
+            j = index.get(target_id)
+            if j is not None and j != i:
+                outgoing[i].append(j)
+                incoming[j].append(i)
+    return index, outgoing, incoming
+
+def layered_layout(node_ids, edges, root_id=None, progress=None, cancel_event=None):
+    # Sugiyama style: layers by breadth-first distance from the root (then from the nodes
+    # nobody links to, for the parts the root does not reach), barycenter ordering inside
+    # the layers, then rows. Linear in nodes + edges per sweep.
+    index, outgoing, incoming = layout_adjacency(node_ids, edges)
+    n = len(node_ids)
+    layer_of = [-1] * n
+    starts = [index[root_id]] if root_id in index else []
+    starts += [i for i in range(n) if not incoming[i]] + list(range(n))
+    layers = []
+    for start in starts:
+        if layer_of[start] != -1: continue
+        layer_of[start] = 0
+        frontier = [start]
+        depth = 0
+        while frontier:
+            if depth == len(layers): layers.append([])
+            layers[depth].extend(frontier)
+            next_frontier = []
+            for i in frontier:
+                for j in outgoing[i]:
+                    if layer_of[j] == -1:
+                        layer_of[j] = depth + 1
+                        next_frontier.append(j)
+            frontier = next_frontier
+            depth += 1
+
+    rank = [0.0] * n # Position inside the layer, 0..1 so layers of any size compare
+    def set_ranks(layer):
+        for k, i in enumerate(layer): rank[i] = (k + 0.5) / len(layer)
+    for layer in layers: set_ranks(layer)
+    def barycenter(i, neighbours, layer_index):
+        above = [rank[j] for j in neighbours[i] if layer_of[j] == layer_index]
+        return sum(above) / len(above) if above else rank[i]
+    for sweep in range(LAYOUT_ORDER_SWEEPS):
+        if cancel_event is not None and cancel_event.is_set(): return None
+        for d in range(1, len(layers)):
+            layers[d].sort(key=lambda i: barycenter(i, incoming, d - 1))
+            set_ranks(layers[d])
+        for d in range(len(layers) - 2, -1, -1):
+            layers[d].sort(key=lambda i: barycenter(i, outgoing, d + 1))
+            set_ranks(layers[d])
+        if progress: progress((sweep + 1) / LAYOUT_ORDER_SWEEPS)
+
+    positions = {}
+    widest = min(LAYOUT_MAX_ROW, max((len(layer) for layer in layers), default=0))
+    y = 0
+    for layer in layers:
+        for row_start in range(0, len(layer), LAYOUT_MAX_ROW):
+            row = layer[row_start:row_start + LAYOUT_MAX_ROW]
+            x = (widest - len(row)) * LAYOUT_H_SPACING / 2 # Centered rows
+            for i in row:
+                positions[node_ids[i]] = (x, y)
+                x += LAYOUT_H_SPACING
+            y += LAYOUT_V_SPACING
+    return positions
+
+def build_quadtree(points, xs, ys, x0, y0, size, depth=0):
+    # Cell = [mass, center x, center y, size, children or None, points]
+    if len(points) == 1 or depth > 30: # Depth cap: nodes sitting on the same spot share a leaf
+        return [len(points), sum(xs[i] for i in points) / len(points), sum(ys[i] for i in points) / len(points), size, None, points]
+    half = size / 2
+    quads = ([], [], [], [])
+    for i in points:
+        quads[(xs[i] >= x0 + half) + 2 * (ys[i] >= y0 + half)].append(i)
+    children = [build_quadtree(quad, xs, ys, x0 + half * (q & 1), y0 + half * (q >> 1), half, depth + 1)
+                for q, quad in enumerate(quads) if quad]
+    mass = len(points)
+    return [mass, sum(c[0] * c[1] for c in children) / mass, sum(c[0] * c[2] for c in children) / mass, size, children, None]
+
+def force_layout(node_ids, edges, start_positions, iterations=None, progress=None, cancel_event=None):
+    # Fruchterman-Reingold with Barnes-Hut repulsion: O(n log n) per iteration instead of O(n^2)
+    n = len(node_ids)
+    if n < 2: return dict(start_positions)
+    index, outgoing, _ = layout_adjacency(node_ids, edges)
+    if iterations is None: iterations = max(10, min(60, 1000000 // n))
+    xs = [start_positions[node_id][0] for node_id in node_ids]
+    ys = [start_positions[node_id][1] for node_id in node_ids]
+    k = LAYOUT_H_SPACING # Ideal edge length
+    k2 = k * k
+    theta2 = BARNES_HUT_THETA * BARNES_HUT_THETA
+    temperature = k * math.sqrt(n) / 2
+    rng = random.Random(0)
+    all_points = list(range(n))
+    for iteration in range(iterations):
+        if cancel_event is not None and cancel_event.is_set(): return None
+        x0, y0 = min(xs), min(ys)
+        size = max(max(xs) - x0, max(ys) - y0) + 1
+        tree = build_quadtree(all_points, xs, ys, x0, y0, size)
+        dx_total = [0.0] * n
+        dy_total = [0.0] * n
+        for i in range(n):
+            xi, yi = xs[i], ys[i]
+            fx = fy = 0.0
+            stack = [tree]
+            while stack:
+                cell = stack.pop()
+                dx, dy = xi - cell[1], yi - cell[2]
+                d2 = dx * dx + dy * dy
+                if cell[4] is None or cell[3] * cell[3] < theta2 * d2:
+                    mass = cell[0]
+                    if cell[4] is None and i in cell[5]: mass -= 1 # Not pushed by itself
+                    if mass <= 0: continue
+                    if d2 < 1.0: # Same spot: push in a random direction
+                        dx, dy = rng.uniform(-1, 1), rng.uniform(-1, 1)
+                        d2 = dx * dx + dy * dy + 0.01
+                    f = k2 * mass / d2
+                    fx += dx * f
+                    fy += dy * f
+                else:
+                    stack.extend(cell[4])
+            dx_total[i] += fx
+            dy_total[i] += fy
+        for i in range(n):
+            for j in outgoing[i]: # Attraction along the links
+                dx, dy = xs[i] - xs[j], ys[i] - ys[j]
+                d = math.sqrt(dx * dx + dy * dy) + 0.01
+                f = d / k
+                dx_total[i] -= dx * f
+                dy_total[i] -= dy * f
+                dx_total[j] += dx * f
+                dy_total[j] += dy * f
+        for i in range(n):
+            d = math.sqrt(dx_total[i] * dx_total[i] + dy_total[i] * dy_total[i])
+            if d > 0:
+                step = min(d, temperature) / d
+                xs[i] += dx_total[i] * step
+                ys[i] += dy_total[i] * step
+        temperature *= 0.93
+        if progress: progress((iteration + 1) / iterations)
+    x0, y0 = min(xs), min(ys)
+    return {node_id: (xs[i] - x0, ys[i] - y0) for i, node_id in enumerate(node_ids)}
+
+def compute_layout(mode, node_ids, edges, root_id, post, cancel_event):
+    # Worker thread: posts ("progress", fraction, text), then ("done", positions) or ("error", text)
+    try:
+        if mode == "force":
+            start = layered_layout(node_ids, edges, root_id, lambda f: post(("progress", 0.2 * f, "Layered start...")), cancel_event)
+            if start is None: return
+            positions = force_layout(node_ids, edges, start, None, lambda f: post(("progress", 0.2 + 0.8 * f, "Force-directed layout...")), cancel_event)
+        else:
+            positions = layered_layout(node_ids, edges, root_id, lambda f: post(("progress", f, "Layered layout...")), cancel_event)
+        if positions is not None: post(("done", positions))
+    except Exception as e:
+        post(("error", str(e)))
+
+# --- Graph ---
+class ConversationGraph:
+    # Conversation data (node id -> node dict) plus a reverse index of the links between the
+    # nodes, so renaming or deleting a node only touches the nodes that link to it.
+    def __init__(self, data=None):
+        self.data = data if data is not None else {}
+        self.ref_index = {}  # target id -> set of (source id, key path), missing targets included
+        self.node_refs = {}  # source id -> [(key path, target id)], what ref_index holds for it
+        self.rebuild_ref_index()
+
+    def rebuild_ref_index(self):
+        self.ref_index.clear()
+        self.node_refs.clear()
+        for node_id in self.data:
+            self.index_node_refs(node_id)
+
+    def unindex_node_refs(self, node_id):
+        for key_path, target_id in self.node_refs.pop(node_id, ()):
+            referrers = self.ref_index.get(target_id)
+            if referrers is not None:
+                referrers.discard((node_id, key_path))
+                if not referrers: del self.ref_index[target_id]
+
+    def index_node_refs(self, node_id):
+        # (Re)records the outgoing links of one node. Call after anything that changes them.
+        self.unindex_node_refs(node_id)
+        if node_id not in self.data: return
+        refs = list(iter_node_links(self.data[node_id]))
+        self.node_refs[node_id] = refs
+        for key_path, target_id in refs:
+            self.ref_index.setdefault(target_id, set()).add((node_id, key_path))
+
+    def rename_node(self, old_id, new_id):
+        # Moves a node to a free id and rewrites the links pointing at it. Links that already
+        # pointed at the (missing) new_id lead to it too. Returns the ids of the nodes whose
+        # links changed, under their new id.
+        self.data[new_id] = self.data.pop(old_id)
+        referrers = list(self.ref_index.get(old_id, ())) # Copy: unindexing a self link edits the set
+        self.unindex_node_refs(old_id)
+        for source_id, key_path in referrers:
+            if source_id == old_id: source_id = new_id # Self link
+            set_link_value(self.data[source_id], key_path, new_id)
+        self.index_node_refs(new_id)
+        referrer_ids = {new_id if source_id == old_id else source_id for source_id, _ in referrers}
+        for source_id in referrer_ids:
+            self.index_node_refs(source_id)
+        return referrer_ids
+
+    def rename_steps(self, mapping):
+        # Checks a bulk rename ({old_id: new_id}) and orders it into single renames that never
+        # hit a live id (chains like a->b, b->c go through temporary ids).
+        # Returns (error message or None, [(old_id, new_id), ...]).
+        mapping = {old: new for old, new in mapping.items() if old != new and old in self.data}
+        new_ids = list(mapping.values())
+        if any(not new_id for new_id in new_ids):
+            return "Renaming would produce an empty node ID.", []
+        if len(set(new_ids)) != len(new_ids):
+            return "Renaming would give several nodes the same ID.", []
+        clashes = [new_id for new_id in new_ids if new_id in self.data and new_id not in mapping]
+        if clashes:
+            return f"Node ID '{clashes[0]}' already exists.", []
+        if not set(new_ids) & set(mapping):
+            return None, list(mapping.items())
+        steps, final = [], []
+        for i, old_id in enumerate(mapping):
+            temp_id = f"__renaming_{i}__"
+            while temp_id in self.data or temp_id in mapping.values(): temp_id += "_"
+            steps.append((old_id, temp_id))
+            final.append((temp_id, mapping[old_id]))
+        return None, steps + final
+
+    def bulk_rename(self, mapping):
+        # Renames several nodes at once, returns an error message or None
+        error, steps = self.rename_steps(mapping)
+        if error: return error
+        for old_id, new_id in steps:
+            self.rename_node(old_id, new_id)
+        return None
+
+    def remove_node(self, node_id):
+        # Deletes a node and clears the links pointing at it (they become ""). Returns the ids
+        # of the nodes whose links changed.
+        del self.data[node_id]
+        self.unindex_node_refs(node_id)
+        referrer_ids = set()
+        for source_id, key_path in list(self.ref_index.pop(node_id, ())):
+            set_link_value(self.data[source_id], key_path, "")
+            referrer_ids.add(source_id)
+        for source_id in referrer_ids:
+            self.index_node_refs(source_id)
+        return referrer_ids
+
+    def edges(self, node_ids=None):
+        # {source id: [target ids]} of the links between existing nodes (of node_ids only if given)
+        node_set = self.data if node_ids is None else set(node_ids)
+        return {source_id: [target_id for _, target_id in self.node_refs.get(source_id, ()) if target_id in node_set]
+                for source_id in node_set if source_id in self.data}
+
+    def reachable(self, root_id=ROOT_NODE_ID):
+        # Ids of the nodes a player can get to from root_id, breadth first. Follows the links
+        # the runtime follows (iter_runtime_links, like validate), action jumps included.
+        if root_id not in self.data: return set()
+        seen = {root_id}
+        todo = deque([root_id])
+        while todo:
+            for _, target_id in iter_runtime_links(self.data[todo.popleft()]):
+                if target_id in self.data and target_id not in seen:
+                    seen.add(target_id)
+                    todo.append(target_id)
+        return seen
+
+    def prune(self, root_id=ROOT_NODE_ID):
+        # Deletes every node root_id does not lead to, returns their ids. Only unreachable
+        # nodes link to them (and the choices of entry mode nodes, which the runtime never shows).
+        if root_id not in self.data: return []
+        keep = self.reachable(root_id)
+        removed = [node_id for node_id in self.data if node_id not in keep]
+        for node_id in removed:
+            self.remove_node(node_id)
+        return removed
+
+    def layout(self, mode="layered", missing_only=True):
+        # Gives nodes an editor_pos from compute_layout: only the ones without a position (placed
+        # below the others, like the editor does) or all of them. Returns the number placed.
+        def has_pos(node_data):
+            pos = node_data.get('editor_pos')
+            return isinstance(pos, (list, tuple)) and len(pos) == 2
+        node_ids = [nid for nid, node_data in self.data.items() if not (missing_only and has_pos(node_data))]
+        if not node_ids: return 0
+        placed = [self.data[nid]['editor_pos'] for nid in self.data if missing_only and has_pos(self.data[nid])]
+        origin = (min(x for x, _ in placed), max(y for _, y in placed) + BASE_NODE_HEIGHT + LAYOUT_V_SPACING) if placed else (50, 50)
+        result = []
+        compute_layout(mode, node_ids, self.edges(node_ids), ROOT_NODE_ID if ROOT_NODE_ID in node_ids else None,
+                       lambda message: result.append(message), threading.Event())
+        if result[-1][0] == "error": raise ValueError(result[-1][1])
+        for node_id, (x, y) in result[-1][1].items():
+            self.data[node_id]['editor_pos'] = (x + origin[0], y + origin[1])
+        return len(node_ids)
+
+    def validate(self, root_id=ROOT_NODE_ID):
+        # Issues of the whole graph, see validate_graph
+        return validate_graph(self.data, root_id)
+
+def load_conversation(path):
+    # Reads a conversation file in one go, raises ValueError (or OSError) if it can not be used
+    nodes, errors = {}, []
+    def post(message):
+        if message[0] == "nodes": nodes.update(message[1]) # Duplicate ids: last one wins
+        elif message[0] == "error": errors.append(message[1])
+    if not os.path.isfile(path): raise OSError(f"No such file: {path}")
+    if is_project_file(path): parse_project_file(path, post, threading.Event())
+    else: parse_conversation_file(path, post, threading.Event())
+    if errors: raise ValueError(errors[0])
+    return nodes
+
+def save_conversation(path, data, compact=False):
+    # Atomic write, same output as the editor's save
+    errors = []
+    def post(message):
+        if message[0] == "error": errors.append(message[1])
+    if is_project_file(path): write_project_file(path, list(data.items()), post)
+    else: write_conversation_file(path, list(data.items()), {}, compact, post)
+    if errors: raise OSError(errors[0])
+
+# --- Validation ---
+# Checks what would strand a player in js/main.js: links to missing nodes (its "lost my train of
+# thought" fallback), nodes the start node does not lead to, nodes with no way forward and
+# loops with no way out. The runtime shows the secrets of an entry_mode node instead of its
+# choices, some actions jump to fixed nodes, and "end_conversation"/"kill" close the dialog
+# (after "kill" the runtime only ever shows the "killed" node).
+# An issue is (severity, kind, node id or None, message).
+ISSUE_ERROR = "error"
+ISSUE_WARNING = "warning"
+ACTION_TARGETS = {"increase_spare": ("spare_success", "kill"), "check_espresso": ("give", "give_failed"),
+                  "check_cappuccino": ("give", "give_failed"), "check_latte": ("give", "give_failed"),
+                  "kill": ("killed",)}
+EXIT_ACTIONS = {"end_conversation", "kill"}
+KNOWN_ACTIONS = set(ACTION_TARGETS) | EXIT_ACTIONS | {"save_espresso", "save_cappuccino", "save_latte", "website", "clear_inventory"}
+
+def iter_runtime_links(node_data):
+    # Yields (key_path, target_id) for every node the runtime can show after this one
+    entry_mode = node_data.get("entry_mode")
+    if entry_mode:
+        for i, secret in enumerate(entry_mode.get("secrets", [])):
+            if secret.get("next_node_id"): yield f"entry_mode.secrets.{i}.next_node_id", secret["next_node_id"]
+        if entry_mode.get("default_next_node_id"):
+            yield "entry_mode.default_next_node_id", entry_mode["default_next_node_id"]
+        return
+    for i, choice in enumerate(node_data.get("choices", [])):
+        if choice.get("next_node_id"): yield f"choices.{i}.next_node_id", choice["next_node_id"]
+        for target_id in ACTION_TARGETS.get(choice.get("action"), ()):
+            yield f"choices.{i}.action", target_id
+
+def node_can_exit(node_data):
+    # Whether one of the node's choices closes the conversation
+    return not node_data.get("entry_mode") and any(choice.get("action") in EXIT_ACTIONS for choice in node_data.get("choices", []))
+
+def node_issues(data, node_id):
+    # Issues found by looking at one node only (cheap, rerun for the nodes an edit touched)
+    node_data = data[node_id]
+    issues = []
+    has_next = False
+    for key_path, target_id in iter_runtime_links(node_data):
+        has_next = True
+        if target_id in data: continue
+        if key_path.endswith(".action"):
+            message = f"Action '{get_path_value(node_data, key_path)}' jumps to missing node '{target_id}'"
+        else:
+            message = f"'{key_path}' points to missing node '{target_id}'"
+        issues.append((ISSUE_ERROR, "dangling", node_id, message))
+    if node_data.get("entry_mode"):
+        if node_data.get("choices"):
+            issues.append((ISSUE_WARNING, "hidden_choices", node_id, "Choices of an entry node are never shown"))
+    else:
+        for i, choice in enumerate(node_data.get("choices", [])):
+            action = choice.get("action")
+            if action and action not in KNOWN_ACTIONS:
+                issues.append((ISSUE_WARNING, "unknown_action", node_id, f"Choice {i + 1} has unknown action '{action}'"))
+            if not choice.get("next_node_id") and action not in EXIT_ACTIONS and action not in ACTION_TARGETS:
+                issues.append((ISSUE_WARNING, "empty_choice", node_id, f"Choice {i + 1} ('{choice.get('text', '')}') leads nowhere"))
+    if not has_next and not node_can_exit(node_data):
+        issues.append((ISSUE_WARNING, "dead_end", node_id, "Dead end: the player can not go on from here"))
+    return issues
+
+def node_issues_all(data):
+    return [issue for node_id in data for issue in node_issues(data, node_id)]
+
+def strongly_connected_components(successors):
+    # Tarjan's algorithm without recursion. successors[i] lists the node numbers i links to.
+    # Returns the component number of every node.
+    n = len(successors)
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    component = [-1] * n
+    stack = []
+    counter = components = 0
+    for root in range(n):
+        if index[root] != -1: continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, 0)] # (node, next successor to look at)
+        while work:
+            v, i = work[-1]
+            if i < len(successors[v]):
+                work[-1] = (v, i + 1)
+                w = successors[v][i]
+                if index[w] == -1:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w, 0))
+                elif on_stack[w] and index[w] < low[v]:
+                    low[v] = index[w]
+                continue
+            work.pop()
+            if work and low[v] < low[work[-1][0]]: low[work[-1][0]] = low[v]
+            if low[v] == index[v]:
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    component[w] = components
+                    if w == v: break
+                components += 1
+    return component
+
+def graph_issues(data, root_id=ROOT_NODE_ID):
+    # Issues that depend on the whole graph: reachability from root_id (breadth first) and
+    # loops with no way out (strongly connected components no link or exit leaves).
+    # Linear in nodes + links.
+    if root_id not in data:
+        return [(ISSUE_ERROR, "missing_root", None, f"There is no '{root_id}' node")]
+    node_ids = list(data)
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+    successors = [[index[target_id] for _, target_id in iter_runtime_links(data[node_id]) if target_id in index]
+                  for node_id in node_ids]
+    reached = [False] * len(node_ids)
+    reached[index[root_id]] = True
+    todo = deque([index[root_id]])
+    while todo:
+        for j in successors[todo.popleft()]:
+            if not reached[j]:
+                reached[j] = True
+                todo.append(j)
+    issues = [(ISSUE_WARNING, "unreachable", node_id, f"Not reachable from '{root_id}'")
+              for node_id, seen in zip(node_ids, reached) if not seen]
+
+    component = strongly_connected_components(successors)
+    members = {}
+    open_components = set() # Left by a link or an exit
+    for i, node_id in enumerate(node_ids):
+        if not reached[i]: continue
+        members.setdefault(component[i], []).append(i)
+        if node_can_exit(data[node_id]) or any(component[j] != component[i] for j in successors[i]):
+            open_components.add(component[i])
+    for c, nodes in members.items():
+        if c in open_components: continue
+        if len(nodes) == 1 and nodes[0] not in successors[nodes[0]]: continue # A dead end, not a loop
+        names = ", ".join(node_ids[i] for i in nodes[:5]) + (", ..." if len(nodes) > 5 else "")
+        for i in nodes:
+            issues.append((ISSUE_ERROR, "trap_loop", node_ids[i], f"In a loop with no way out ({len(nodes)} nodes: {names})"))
+    return issues
+
+def validate_graph(data, root_id=ROOT_NODE_ID):
+    return node_issues_all(data) + graph_issues(data, root_id)
+
+def check_graph(data, with_nodes, post):
+    # Worker thread: posts ("done", per-node issues or None, whole-graph issues) or ("error", text).
+    # with_nodes runs the per-node checks too. data is a copy of the top-level dict, the UI
+    # thread may still edit the nodes in it, the caller checks again after such edits anyway.
+    try:
+        post(("done", node_issues_all(data) if with_nodes else None, graph_issues(data)))
+    except Exception as e:
+        post(("error", str(e)))
+
+# --- Runtime bundle ---
+# What js/main.js loads instead of conversation.json when it is there: minified, without the
+# editor's editor_pos, with node ids replaced by node numbers and strings used more than once
+# (sprite_image paths, repeated choice texts, ...) stored once. Only the ids main.js jumps to
+# by name are kept. Node numbers follow a breadth-first walk from the root, so with a chunk
+# size the nodes a player sees early are in the first file and the rest is fetched on the way.
+#   {"format": "conversation-bundle", "version": 1, "count": nodes, "root": 0,
+#    "names": {"start": 0, "give": 7, ...}, "strings": [...], "nodes": [first chunk],
+#    "chunk_size": n, "chunks": ["conversation.bundle.1.json", ...]}
+# A chunk file is {"first": node number of its first node, "nodes": [...]}. In a node a number
+# under a link key is a node number (0, the root, is a link too), any other number is an index
+# into "strings".
+BUNDLE_FORMAT = "conversation-bundle"
+BUNDLE_VERSION = 1
+BUNDLE_LINK_KEYS = ("next_node_id", "default_next_node_id")
+BUNDLE_EDITOR_KEYS = ("editor_pos",)
+_BUNDLE_FILE = re.compile(r'\.bundle(\.\d+)?\.json$')
+
+try:
+    import brotli # Optional, a .br file is written next to the .gz one when it is installed
+except ImportError:
+    brotli = None
+
+def is_bundle_file(path):
+    return bool(_BUNDLE_FILE.search(path))
+
+def bundle_chunk_path(path, chunk):
+    # conversation.bundle.json -> conversation.bundle.3.json
+    base = path[:-len(".json")] if path.endswith(".json") else path
+    return f"{base}.{chunk}.json"
+
+def runtime_order(data, root_id=ROOT_NODE_ID):
+    # Node ids breadth first from root_id along the links the runtime follows, then the nodes
+    # it never gets to in file order
+    order = []
+    if root_id in data:
+        seen = {root_id}
+        todo = deque([root_id])
+        while todo:
+            node_id = todo.popleft()
+            order.append(node_id)
+            for _, target_id in iter_runtime_links(data[node_id]):
+                if target_id in data and target_id not in seen:
+                    seen.add(target_id)
+                    todo.append(target_id)
+        order.extend(node_id for node_id in data if node_id not in seen)
+    else:
+        order = list(data)
+    return order
+
+def encode_runtime_bundle(data, root_id=ROOT_NODE_ID, chunk_size=0):
+    # Returns (manifest, chunks): chunks are the node lists of the chunk files after the first
+    # one, whose nodes are in the manifest. data may be edited by the UI thread meanwhile, a node
+    # that changes while it is read is read again (a string that was not counted stays inline).
+    order = runtime_order(data, root_id)
+    numbers = {node_id: i for i, node_id in enumerate(order)}
+    nodes = [data[node_id] for node_id in order]
+
+    def retried(function, *args):
+        while True:
+            try:
+                return function(*args)
+            except RuntimeError: # Changed size during iteration
+                pass
+
+    counts = {}
+    def count_strings(value, key):
+        if isinstance(value, dict):
+            for k, v in value.items():
+                if k not in BUNDLE_EDITOR_KEYS: count_strings(v, k)
+        elif isinstance(value, list):
+            for v in value: count_strings(v, key)
+        elif isinstance(value, str) and key not in BUNDLE_LINK_KEYS:
+            counts[value] = counts.get(value, 0) + 1
+    for node in nodes: retried(count_strings, node, None)
+    strings = []
+    string_index = {}
+    for text, count in sorted(counts.items(), key=lambda item: -item[1]):
+        if count < 2: break
+        if len(json.dumps(text, ensure_ascii=False)) <= len(str(len(strings))): continue # The number is not shorter
+        string_index[text] = len(strings)
+        strings.append(text)
+
+    def encode(value, key, node_id):
+        if isinstance(value, dict):
+            return {k: encode(v, k, node_id) for k, v in value.items() if k not in BUNDLE_EDITOR_KEYS}
+        if isinstance(value, list):
+            return [encode(v, key, node_id) for v in value]
+        if key in BUNDLE_LINK_KEYS:
+            return numbers.get(value, value) # A link to a missing node stays a string, main.js reports it
+        if isinstance(value, str):
+            return string_index.get(value, value)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            raise ValueError(f"Node '{node_id}': number under '{key}' can not go into a bundle (numbers stand for strings there)")
+        return value
+    encoded = [retried(encode, node, None, node_id) for node_id, node in zip(order, nodes)]
+
+    names = [root_id] + [target_id for targets in ACTION_TARGETS.values() for target_id in targets]
+    manifest = {"format": BUNDLE_FORMAT, "version": BUNDLE_VERSION, "count": len(encoded),
+                "root": numbers.get(root_id, -1),
+                "names": {name: numbers[name] for name in dict.fromkeys(names) if name in numbers},
+                "strings": strings}
+    if chunk_size and len(encoded) > chunk_size:
+        chunks = [encoded[i:i + chunk_size] for i in range(0, len(encoded), chunk_size)]
+        manifest["nodes"] = chunks[0]
+        manifest["chunk_size"] = chunk_size
+        return manifest, chunks[1:]
+    manifest["nodes"] = encoded
+    return manifest, []
+
+def write_file_atomic(path, payload):
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if tmp_path and os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+
+def write_runtime_bundle(path, data, root_id=ROOT_NODE_ID, chunk_size=0, compress=True):
+    # Writes the bundle (and its chunk files) next to each other, with .gz copies (and .br ones
+    # when brotli is installed) for servers that send precompressed files. Chunk files left
+    # over from an earlier export with more chunks are deleted. Returns [(path, bytes), ...].
+    manifest, chunks = encode_runtime_bundle(data, root_id, chunk_size)
+    if chunks:
+        manifest["chunks"] = [os.path.basename(bundle_chunk_path(path, i + 1)) for i in range(len(chunks))]
+    files = [(path, manifest)]
+    for i, nodes in enumerate(chunks):
+        files.append((bundle_chunk_path(path, i + 1), {"first": (i + 1) * chunk_size, "nodes": nodes}))
+    written = []
+    for file_path, content in files:
+        payload = json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        variants = [(file_path, payload)]
+        if compress:
+            variants.append((file_path + ".gz", gzip.compress(payload, compresslevel=9, mtime=0)))
+            if brotli is not None:
+                variants.append((file_path + ".br", brotli.compress(payload)))
+        for variant_path, variant in variants:
+            write_file_atomic(variant_path, variant)
+            written.append((variant_path, len(variant)))
+    chunk = len(chunks) + 1
+    while True: # Stale chunks of an earlier export
+        chunk_path = bundle_chunk_path(path, chunk)
+        stale = [p for p in (chunk_path, chunk_path + ".gz", chunk_path + ".br") if os.path.exists(p)]
+        if not stale: break
+        for stale_path in stale: os.remove(stale_path)
+        chunk += 1
+    return written
+
+def export_runtime_bundle(path, data, root_id, chunk_size, post):
+    # Worker thread: posts ("done", [(path, bytes), ...]) or ("error", text)
+    try:
+        post(("done", write_runtime_bundle(path, data, root_id, chunk_size)))
+    except Exception as e:
+        post(("error", str(e)))
+
+# --- Search ---
+# Inverted index over the words of the node texts (node id, sprite_text, choice text, item,
+# action, secret input, prompt_text) and over facts about the node structure, updated one node
+# at a time. A query is a list of words and filters that must all match:
+#   madam espr            words, the last letters of a word may be missing (prefix), and a
+#                         word with no such match finds the words one typo away from it
+#   action == kill        a field of the node, a choice or a secret has this value (!= for not)
+#   has entry_mode        the node, a choice or a secret has this field
+#   not has choices       "not" in front of a word or filter turns it around
+# Quotes keep a value with spaces together: item == "flat white".
+SEARCH_TEXT_FIELDS = ("sprite_text", "text", "item", "action", "input", "prompt_text")
+SEARCH_VALUE_FIELDS = ("id", "action", "item", "sprite_image", "input", "next_node_id", "default_next_node_id", "prompt_text")
+SEARCH_FUZZY_MIN_LENGTH = 4 # Shorter words have too many neighbours one typo away
+_SEARCH_WORD = re.compile(r"[^\W_]+") # node_ids split at the underscores
+_SEARCH_OPERATOR = re.compile(r"(==|!=)")
+
+def edit_distance(a, b, limit):
+    # Levenshtein distance with swapped neighbours counting as one edit, limit + 1 once it is over limit
+    if abs(len(a) - len(b)) > limit: return limit + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            row[j] = min(previous[j] + 1, row[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], previous2[j - 2] + 1)
+        if min(row) > limit: return limit + 1
+        previous2, previous = previous, row
+    return previous[-1]
+
+def search_words(text):
+    return _SEARCH_WORD.findall(text.casefold())
+
+def node_search_terms(node_id, node_data):
+    # (words, facts) of a node. Facts are ("has", field) and ("eq", field, value), the id is
+    # looked up in the index itself.
+    words = set(search_words(node_id))
+    facts = set()
+    entry_mode = node_data.get("entry_mode")
+    parts = [node_data] + node_data.get("choices", [])
+    if isinstance(entry_mode, dict): parts += [entry_mode] + entry_mode.get("secrets", [])
+    for part in parts:
+        for key, value in part.items():
+            if key == "editor_pos": continue
+            facts.add(("has", key))
+            if type(value) is str:
+                if key in SEARCH_TEXT_FIELDS: words.update(search_words(value))
+                if key in SEARCH_VALUE_FIELDS: facts.add(("eq", key, value.casefold()))
+    return words, facts
+
+def word_deletes(word):
+    # The word and the words one letter shorter, two words one typo apart share one of these
+    return {word} | {word[:i] + word[i + 1:] for i in range(len(word))}
+
+def typo_word(word):
+    # Only real words get typo matches, not numbers or ids like n1234
+    return len(word) >= SEARCH_FUZZY_MIN_LENGTH and word.isalpha()
+
+# Most words and facts belong to one node (every id, most links), those are stored as the bare
+# node id instead of a set of one
+def posting_add(table, key, node_id):
+    nodes = table.get(key)
+    if nodes is None: table[key] = node_id
+    elif isinstance(nodes, set): nodes.add(node_id)
+    elif nodes != node_id: table[key] = {nodes, node_id}
+
+def posting_discard(table, key, node_id):
+    # Returns True when the key is gone
+    nodes = table[key]
+    if isinstance(nodes, set):
+        nodes.discard(node_id)
+        if len(nodes) > 1: return False
+        if nodes:
+            table[key] = next(iter(nodes))
+            return False
+    elif nodes != node_id: return False
+    del table[key]
+    return True
+
+def posting_nodes(nodes):
+    if nodes is None: return ()
+    return nodes if isinstance(nodes, set) else (nodes,)
+
+class SearchIndex:
+    def __init__(self, data=None):
+        self.node_terms = {} # node id -> (words, facts), as tuples
+        self.postings = {}   # word -> node id(s)
+        self.facts = {}      # fact -> node id(s)
+        self.words = []      # Sorted words, for prefixes
+        self.deletes = {}    # word_deletes() key -> word(s), for typos
+        for node_id in list(data or ()):
+            while True:
+                try:
+                    words, facts = node_search_terms(node_id, data[node_id])
+                    break
+                except RuntimeError: # Another thread changed the node meanwhile
+                    pass
+                except KeyError: # Or deleted it
+                    words = None
+                    break
+            if words is None: continue
+            self.node_terms[node_id] = (tuple(words), tuple(facts))
+            for word in words: posting_add(self.postings, word, node_id)
+            for fact in facts: posting_add(self.facts, fact, node_id)
+        self.words = sorted(self.postings)
+        for word in self.words:
+            if typo_word(word):
+                for key in word_deletes(word): posting_add(self.deletes, key, word)
+
+    def __len__(self):
+        return len(self.node_terms)
+
+    def update(self, node_id, node_data):
+        # Call after a node changed, with None after it was deleted
+        words, facts = node_search_terms(node_id, node_data) if node_data is not None else (set(), set())
+        old_words, old_facts = self.node_terms.pop(node_id, ((), ()))
+        if node_data is not None: self.node_terms[node_id] = (tuple(words), tuple(facts))
+        old_words, old_facts = set(old_words), set(old_facts)
+        for word in old_words - words:
+            if posting_discard(self.postings, word, node_id): self.drop_word(word)
+        for word in words - old_words:
+            if word not in self.postings: self.add_word(word)
+            posting_add(self.postings, word, node_id)
+        for fact in old_facts - facts:
+            posting_discard(self.facts, fact, node_id)
+        for fact in facts - old_facts:
+            posting_add(self.facts, fact, node_id)
+
+    def remove(self, node_id):
+        self.update(node_id, None)
+
+    def add_word(self, word):
+        bisect.insort(self.words, word)
+        if typo_word(word):
+            for key in word_deletes(word): posting_add(self.deletes, key, word)
+
+    def drop_word(self, word):
+        del self.words[bisect.bisect_left(self.words, word)]
+        if typo_word(word):
+            for key in word_deletes(word): posting_discard(self.deletes, key, word)
+
+    def word_matches(self, word):
+        # node id -> score: 3 for the word itself, 2 for a longer word it starts, 1 for a typo
+        scores = {}
+        start = bisect.bisect_left(self.words, word)
+        end = bisect.bisect_left(self.words, word + "\U0010ffff", start)
+        for other in self.words[start:end]:
+            score = 3 if other == word else 2
+            for node_id in posting_nodes(self.postings[other]):
+                if scores.get(node_id, 0) < score: scores[node_id] = score
+        if not scores and typo_word(word):
+            candidates = set()
+            for key in word_deletes(word):
+                candidates.update(posting_nodes(self.deletes.get(key)))
+            for other in candidates:
+                if edit_distance(word, other, 1) <= 1:
+                    for node_id in posting_nodes(self.postings[other]): scores[node_id] = 1
+        return scores
+
+    def field_nodes(self, field, value):
+        if field == "id": # Ids are case sensitive
+            return (value,) if value in self.node_terms else ()
+        return posting_nodes(self.facts.get(("eq", field, value.casefold())))
+
+    def search(self, query, limit=None):
+        # Returns (node ids, best matches first, at most limit of them; how many matched).
+        # Raises ValueError for a query that can not be read.
+        try:
+            tokens = shlex.split(_SEARCH_OPERATOR.sub(r" \1 ", query))
+        except ValueError as e:
+            raise ValueError(f"Can not read the query: {e}")
+        filters = [] # (negated, node ids)
+        scores = None
+        i = 0
+        while i < len(tokens):
+            negated = tokens[i].casefold() == "not" and i + 1 < len(tokens)
+            if negated: i += 1
+            token = tokens[i]
+            if token.casefold() == "has" and i + 1 < len(tokens):
+                filters.append((negated, posting_nodes(self.facts.get(("has", tokens[i + 1])))))
+                i += 2
+            elif i + 2 < len(tokens) and tokens[i + 1] in ("==", "!="):
+                if token not in SEARCH_VALUE_FIELDS:
+                    raise ValueError(f"Can not compare '{token}', only {', '.join(SEARCH_VALUE_FIELDS)}")
+                filters.append((negated != (tokens[i + 1] == "!="), self.field_nodes(token, tokens[i + 2])))
+                i += 3
+            elif token in ("==", "!="):
+                raise ValueError(f"'{token}' needs a field before it and a value after it")
+            else:
+                for word in search_words(token):
+                    matches = self.word_matches(word)
+                    if negated:
+                        filters.append((True, matches))
+                    elif scores is None:
+                        scores = matches
+                    else:
+                        scores = {node_id: score + matches[node_id] for node_id, score in scores.items() if node_id in matches}
+                i += 1
+        if scores is None:
+            if not filters: return [], 0
+            positive = [nodes for negated, nodes in filters if not negated]
+            scores = dict.fromkeys(min(positive, key=len) if positive else self.node_terms, 0)
+        for negated, nodes in filters:
+            if not isinstance(nodes, (set, dict)): nodes = set(nodes)
+            scores = {node_id: score for node_id, score in scores.items() if (node_id in nodes) != negated}
+        ranked = ((-score, node_id) for node_id, score in scores.items())
+        ranked = heapq.nsmallest(limit, ranked) if limit is not None else sorted(ranked)
+        return [node_id for _, node_id in ranked], len(scores)
+
+def build_search_index(data, post):
+    # Worker thread: posts ("done", SearchIndex) or ("error", text)
+    try:
+        post(("done", SearchIndex(data)))
+    except Exception as e:
+        post(("error", str(e)))
+
+# --- Simulation ---
+# Plays conversations the way js/main.js does: handleChoice runs the choice's action, then shows
+# its next_node_id unless the action ended the conversation; after a "kill" every node shown is
+# "killed"; increase_spare rewrites the choice's next_node_id for the rest of the session; a
+# missing node leaves the player where they were; an entry node shows its secrets, matched
+# case-insensitively against the trimmed input, and falls back to default_next_node_id.
+# Closing and reopening the dialog starts at the start node again but keeps everything else.
+SAVE_ACTIONS = {"save_espresso": "espresso", "save_cappuccino": "cappuccino", "save_latte": "latte"}
+CHECK_ACTIONS = {"check_espresso": "espresso", "check_cappuccino": "cappuccino", "check_latte": "latte"}
+SPARE_SUCCESS_COUNT = 5 # increase_spare presses until "spare_success"
+KILLED_NODE_ID = "killed"
+SIM_BATCH_WALKS = 2000  # Walks per task of the process pool
+SIM_KILLED_EXAMPLES = 5 # Shortest paths to "killed" kept for the report
+SIM_MAX_STATES = 1_000_000
+SIM_WALK_STEPS = 200    # Moves per random walk at most
+
+# ended: None while the dialog is open, "closed" (end_conversation) or "killed". overrides are
+# the ((node id, choice index), next node id) increase_spare wrote, sorted.
+PlayState = namedtuple("PlayState", "node inventory spared killed item overrides ended")
+
+def play_start(data, node_id=ROOT_NODE_ID, state=None):
+    # Opens the dialog at node_id with a fresh state, or reopens it after state's conversation
+    # ended. Returns (state, events), see play_move.
+    if state is None: state = PlayState(None, frozenset(), 0, False, None, (), None)
+    target = KILLED_NODE_ID if state.killed else node_id
+    if target not in data: return state._replace(node=None, ended=None), [("missing", target)]
+    return state._replace(node=target, ended=None), []
+
+def play_moves(data, state):
+    # What the player can do: ("choice", i), ("secret", i) (typing its input) or ("other",)
+    # (typing anything else). Empty once the conversation ended or at a node without either.
+    if state.ended or state.node not in data: return []
+    node_data = data[state.node]
+    entry_mode = node_data.get("entry_mode")
+    if isinstance(entry_mode, dict):
+        moves, seen = [], set()
+        for i, secret in enumerate(entry_mode.get("secrets", [])):
+            text = str(secret.get("input", "")).lower()
+            # Input is trimmed and never empty, and the first secret with a text wins
+            if text and text == text.strip() and text not in seen: moves.append(("secret", i))
+            seen.add(text)
+        moves.append(("other",))
+        return moves
+    return [("choice", i) for i in range(len(node_data.get("choices", [])))]
+
+def play_typed(data, state, text):
+    # The move typing text at an entry node makes
+    text = text.strip().lower()
+    for move in play_moves(data, state):
+        if move[0] == "secret" and data[state.node]["entry_mode"]["secrets"][move[1]]["input"].lower() == text:
+            return move
+    return ("other",)
+
+def play_move(data, state, move):
+    # Returns (next state, events). Events: ("action", name) and ("missing", node id) for a
+    # node the runtime could not find.
+    node, inventory, spared, killed, item, overrides, ended = state
+    events = []
+    def show(target):
+        nonlocal node
+        if killed: target = KILLED_NODE_ID
+        if target in data: node = target
+        else: events.append(("missing", target))
+    source = node
+    node_data = data[source]
+    if move[0] == "choice":
+        choice = node_data["choices"][move[1]]
+        target = choice.get("next_node_id")
+        for key, value in overrides:
+            if key == (source, move[1]): target = value
+        action = choice.get("action")
+        if choice.get("item"): item = choice["item"]
+        if action: events.append(("action", action))
+        if action == "end_conversation":
+            ended = "closed"
+        elif action in SAVE_ACTIONS:
+            inventory = inventory | {SAVE_ACTIONS[action]}
+        elif action == "increase_spare":
+            spared = min(spared + 1, SPARE_SUCCESS_COUNT)
+            target = "spare_success" if spared >= SPARE_SUCCESS_COUNT else "kill"
+            rewritten = dict(overrides)
+            rewritten[(source, move[1])] = target
+            overrides = tuple(sorted(rewritten.items()))
+            show(target)
+        elif action == "kill":
+            killed = True
+            ended = "killed"
+        elif action in CHECK_ACTIONS:
+            show("give" if CHECK_ACTIONS[action] in inventory else "give_failed")
+        elif action == "clear_inventory":
+            inventory = frozenset()
+        if target and ended != "closed": show(target)
+    elif move[0] == "secret":
+        show(node_data["entry_mode"]["secrets"][move[1]].get("next_node_id"))
+    elif node_data["entry_mode"].get("default_next_node_id"):
+        show(node_data["entry_mode"]["default_next_node_id"])
+    return PlayState(node, inventory, spared, killed, item, overrides, ended), events
+
+def play_move_label(data, state, move):
+    node_data = data[state.node]
+    if move[0] == "choice": return node_data["choices"][move[1]].get("text", "")
+    if move[0] == "secret": return f"type \"{node_data['entry_mode']['secrets'][move[1]].get('input', '')}\""
+    return "type something else"
+
+def new_sim_stats():
+    # Totals of a simulation, merged with merge_sim_stats. choices: (node id, move) taken.
+    # killed_paths: (node id the kill choice is on, node ids from the start on), the shortest ones.
+    return {'walks': 0, 'steps': 0, 'visits': Counter(), 'choices': set(), 'actions': Counter(),
+            'missing': Counter(), 'endings': Counter(), 'states': set(), 'killed_walks': 0,
+            'killed_paths': [], 'truncated': False}
+
+def merge_sim_stats(total, part):
+    for key in ('walks', 'steps', 'killed_walks'): total[key] += part[key]
+    for key in ('visits', 'actions', 'missing', 'endings'): total[key].update(part[key])
+    total['choices'] |= part['choices']
+    total['states'] |= part['states']
+    total['killed_paths'] = shortest_paths(total['killed_paths'] + part['killed_paths'])
+    total['truncated'] = total['truncated'] or part['truncated']
+    return total
+
+def shortest_paths(paths):
+    unique = {(kill_node, tuple(path)): (kill_node, path) for kill_node, path in paths}
+    return sorted(unique.values(), key=lambda item: len(item[1]))[:SIM_KILLED_EXAMPLES]
+
+def sim_record(stats, state, events):
+    for kind, value in events:
+        if kind == "action": stats['actions'][value] += 1
+        else: stats['missing'][(state.node, value)] += 1
+
+def random_walks(data, count, max_steps, seed, root_id=ROOT_NODE_ID, sessions=1):
+    # Plays count walks picking uniformly among the moves. A walk reopens the dialog after its
+    # conversation ended until it played sessions of them, and stops after max_steps moves.
+    rng = random.Random(seed)
+    stats = new_sim_stats()
+    moves_of = {} # node id -> moves, they only depend on the node while the dialog is open
+    for _ in range(count):
+        state, events = play_start(data, root_id)
+        sim_record(stats, state, events)
+        path = [state.node]
+        played, ending = 1, None
+        for _ in range(max_steps):
+            stats['visits'][state.node] += 1
+            stats['states'].add(state)
+            if state.ended:
+                ending = state.ended
+                if played >= sessions: break
+                state, events = play_start(data, root_id, state)
+                sim_record(stats, state, events)
+                played += 1
+                path.append(state.node)
+                continue
+            moves = moves_of.get(state.node)
+            if moves is None: moves = moves_of[state.node] = play_moves(data, state)
+            if not moves:
+                ending = "stuck"
+                break
+            move = rng.choice(moves)
+            stats['choices'].add((state.node, move))
+            previous = state
+            state, events = play_move(data, state, move)
+            sim_record(stats, previous, events)
+            stats['steps'] += 1
+            if state.node != previous.node: path.append(state.node)
+            if state.killed and not previous.killed:
+                stats['killed_walks'] += 1
+                stats['killed_paths'] = shortest_paths(stats['killed_paths'] + [(previous.node, list(path))])
+        else:
+            ending = "max_steps"
+        stats['endings'][ending] += 1
+        stats['walks'] += 1
+    return stats
+
+def explore_states(data, root_id=ROOT_NODE_ID, max_states=SIM_MAX_STATES, reopen=True, progress=None, cancel_event=None):
+    # Every state the player can get into, breadth first (so the paths to "killed" found are
+    # the shortest ones). reopen: a conversation that ended starts again at root_id.
+    stats = new_sim_stats()
+    start, events = play_start(data, root_id)
+    sim_record(stats, start, events)
+    parents = {start: None}
+    todo = deque([start])
+    while todo:
+        if cancel_event is not None and cancel_event.is_set(): raise LoadCancelled()
+        state = todo.popleft()
+        stats['visits'][state.node] += 1
+        if state.ended:
+            stats['endings'][state.ended] += 1
+            if not reopen: continue
+            successors = [play_start(data, root_id, state)]
+        else:
+            moves = play_moves(data, state)
+            if not moves: stats['endings']["stuck"] += 1
+            successors = []
+            for move in moves:
+                stats['choices'].add((state.node, move))
+                successors.append(play_move(data, state, move))
+        for next_state, events in successors:
+            sim_record(stats, state, events)
+            stats['steps'] += 1
+            if next_state in parents: continue
+            if len(parents) >= max_states:
+                stats['truncated'] = True
+                continue
+            parents[next_state] = state
+            todo.append(next_state)
+            if next_state.killed and not state.killed:
+                stats['killed_walks'] += 1
+                if len(stats['killed_paths']) < SIM_KILLED_EXAMPLES:
+                    path, step = [], next_state
+                    while step is not None:
+                        if not path or path[-1] != step.node: path.append(step.node)
+                        step = parents[step]
+                    stats['killed_paths'] = shortest_paths(stats['killed_paths'] + [(state.node, path[::-1])])
+        if progress is not None and len(parents) % 5000 == 0: progress(min(0.99, len(parents) / max_states))
+    stats['states'] = set(parents)
+    return stats
+
+_sim_data = None
+def _sim_worker_init(data):
+    global _sim_data
+    _sim_data = data
+
+def _sim_worker_batch(count, max_steps, seed, root_id, sessions):
+    return random_walks(_sim_data, count, max_steps, seed, root_id, sessions)
+
+def simulate_walks(data, count, max_steps, seed=None, root_id=ROOT_NODE_ID, sessions=1, jobs=None, progress=None, cancel_event=None):
+    # random_walks over a process pool, in batches with their own seeds (the same seed gives the
+    # same totals for any number of jobs). The pool starts with spawn, the editor has threads.
+    seed = random.randrange(1 << 32) if seed is None else seed
+    batches = [(min(SIM_BATCH_WALKS, count - done), max_steps, seed * 1000003 + i, root_id, sessions)
+               for i, done in enumerate(range(0, count, SIM_BATCH_WALKS))]
+    stats = new_sim_stats()
+    if jobs == 1 or len(batches) == 1:
+        for i, batch in enumerate(batches):
+            if cancel_event is not None and cancel_event.is_set(): raise LoadCancelled()
+            merge_sim_stats(stats, random_walks(data, *batch))
+            if progress is not None: progress((i + 1) / len(batches))
+        return stats
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_sim_worker_init, initargs=(data,)) as pool:
+        futures = [pool.submit(_sim_worker_batch, *batch) for batch in batches]
+        try:
+            for i, future in enumerate(futures): # In batch order, so the merge does not depend on timing
+                while True:
+                    if cancel_event is not None and cancel_event.is_set(): raise LoadCancelled()
+                    try:
+                        merge_sim_stats(stats, future.result(timeout=0.1))
+                        break
+                    except FuturesTimeout:
+                        pass
+                if progress is not None: progress((i + 1) / len(batches))
+        except BaseException:
+            for future in futures: future.cancel()
+            raise
+    return stats
+
+def simulation_report(data, stats):
+    # Report lines (node id or None, text): coverage first, then what never happened, then
+    # the problems found on the way
+    lines = []
+    visited = set(stats['visits'])
+    kind = "walk(s)" if stats['walks'] else "state(s) explored"
+    count = stats['walks'] or len(stats['states'])
+    lines.append((None, f"{count} {kind}, {stats['steps']} move(s), {len(stats['states'])} distinct state(s)"
+                        + (" - stopped at the state limit" if stats['truncated'] else "")))
+    lines.append((None, f"Visited {len(visited & set(data))} of {len(data)} node(s)"))
+    all_moves = {(node_id, move) for node_id in data for move in play_moves(data, PlayState(node_id, frozenset(), 0, False, None, (), None))}
+    lines.append((None, f"Took {len(stats['choices'] & all_moves)} of {len(all_moves)} choice(s) and secret(s)"))
+    if stats['endings']:
+        lines.append((None, "Endings: " + ", ".join(f"{name} {n}" for name, n in stats['endings'].most_common())))
+    if stats['actions']:
+        lines.append((None, "Actions fired: " + ", ".join(f"{name} {n}" for name, n in stats['actions'].most_common())))
+    for kill_node, path in stats['killed_paths']: # The path ends at kill_node when the kill choice has no link
+        lines.append((kill_node, f"Reaches 'killed' at '{kill_node}': " + " > ".join(path)))
+    if stats['killed_walks'] and not stats['killed_paths']:
+        lines.append((None, f"{stats['killed_walks']} reached 'killed'"))
+    for (node_id, target_id), n in sorted(stats['missing'].items(), key=str):
+        lines.append((node_id, f"Jumped to missing node '{target_id}' from '{node_id}' ({n}x)"))
+    for node_id, node_data in data.items():
+        for i, choice in enumerate(node_data.get("choices", [])):
+            if choice.get("action") and (node_id, ("choice", i)) not in stats['choices']:
+                lines.append((node_id, f"Action '{choice['action']}' of '{node_id}' choice {i + 1} never fired"))
+    for node_id in data:
+        if node_id not in visited: lines.append((node_id, f"Never visited: {node_id}"))
+    return lines
+
+def copy_graph_data(data):
+    # Deep copy of data while the UI thread may still edit it, a node that changes meanwhile is
+    # copied again and a deleted one left out
+    copied = {}
+    for node_id in list(data):
+        while True:
+            try:
+                copied[node_id] = copy.deepcopy(data[node_id])
+                break
+            except RuntimeError:
+                pass
+            except KeyError:
+                break
+    return copied
+
+def run_simulation(data, mode, options, post, cancel_event):
+    # Worker thread: mode "walks" (random_walks over a pool) or "explore" (explore_states).
+    # Posts ("progress", fraction), then ("done", stats), ("cancelled", None) or ("error", text).
+    try:
+        data = copy_graph_data(data)
+        progress = lambda fraction: post(("progress", fraction))
+        if mode == "walks":
+            stats = simulate_walks(data, options['walks'], options['steps'], options.get('seed'), options['root'],
+                                   options['sessions'], options.get('jobs'), progress, cancel_event)
+        else:
+            stats = explore_states(data, options['root'], options['max_states'], progress=progress, cancel_event=cancel_event)
+        post(("done", stats))
+    except LoadCancelled:
+        post(("cancelled", None))
+    except Exception as e:
+        post(("error", str(e)))
+
+# --- Command line ---
+def conversation_files(paths):
+    # The files named on the command line, directories searched for *.json and projects
+    # (journals and other sidecar files are skipped by the extension, runtime bundles by their name)
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, names in sorted(os.walk(path)):
+                for name in sorted(names):
+                    if (name.endswith(".json") and not is_bundle_file(name)) or is_project_file(name):
+                        yield os.path.join(folder, name)
+        else:
+            yield path
+
+def run_command(command, path, options):
+    # Applies one command to one file (in a worker process for several files).
+    # Returns (path, output lines, failed).
+    try:
+        graph = ConversationGraph(load_conversation(path))
+    except (OSError, ValueError) as e:
+        return path, [f"{path}: error: {e}"], True
+    lines, changed = [], False
+    if command == "validate":
+        issues = graph.validate(options['root'])
+        lines = [f"{path}: {severity}: {node_id + ': ' if node_id else ''}{message}" for severity, _, node_id, message in issues]
+        errors = sum(severity == ISSUE_ERROR for severity, _, _, _ in issues)
+        lines.append(f"{path}: {len(graph.data)} nodes, {errors} error(s), {len(issues) - errors} warning(s)")
+        return path, lines, bool(errors) or (options['strict'] and bool(issues))
+    if command == "rename":
+        mapping = dict(options['map'])
+        if options['regex']:
+            pattern, replacement = options['regex']
+            regex = re.compile(pattern)
+            mapping.update({nid: regex.sub(replacement, nid) for nid in graph.data if regex.search(nid)})
+        mapping = {old: new for old, new in mapping.items() if old in graph.data and old != new}
+        error = graph.bulk_rename(mapping)
+        if error: return path, [f"{path}: error: {error}"], True
+        lines = [f"{path}: {old} -> {new}" for old, new in sorted(mapping.items())]
+        lines.append(f"{path}: renamed {len(mapping)} node(s)")
+        changed = bool(mapping)
+    elif command == "prune":
+        if options['root'] not in graph.data:
+            return path, [f"{path}: error: there is no '{options['root']}' node"], True
+        removed = graph.prune(options['root'])
+        lines = [f"{path}: removed {node_id}" for node_id in removed]
+        lines.append(f"{path}: removed {len(removed)} unreachable node(s)")
+        changed = bool(removed)
+    elif command == "simulate":
+        if options['explore']:
+            stats = explore_states(graph.data, options['root'], options['max_states'])
+        else:
+            stats = simulate_walks(graph.data, options['walks'], options['steps'], options['seed'], options['root'],
+                                   options['sessions'], options['jobs'])
+        return path, [f"{path}: {text}" for _, text in simulation_report(graph.data, stats)], False
+    elif command == "search":
+        try:
+            node_ids, _ = SearchIndex(graph.data).search(options['query'])
+        except ValueError as e:
+            return path, [f"{path}: error: {e}"], True
+        return path, [f"{path}: {node_id}" for node_id in node_ids], False
+    elif command == "bundle":
+        output = options['output'] or re.sub(r'(\.json)?$', ".bundle.json", path, count=1)
+        try:
+            written = write_runtime_bundle(output, graph.data, options['root'], options['chunk_size'], not options['no_compress'])
+        except (OSError, ValueError) as e:
+            return path, [f"{path}: error: {e}"], True
+        lines = [f"{path}: wrote {file_path} ({size} bytes)" for file_path, size in written]
+        return path, lines, False
+    elif command == "convert":
+        output = options['output'] or (re.sub(re.escape(PROJECT_SUFFIX) + "$", ".json", path) if is_project_file(path)
+                                       else re.sub(r'(\.json)?$', PROJECT_SUFFIX, path, count=1))
+        try:
+            save_conversation(output, graph.data, options['compact'])
+        except OSError as e:
+            return path, [f"{path}: error: {e}"], True
+        return path, [f"{path}: wrote {output} ({len(graph.data)} nodes)"], False
+    elif command == "layout":
+        count = graph.layout(options['mode'], missing_only=not options['all'])
+        lines = [f"{path}: placed {count} node(s)"]
+        changed = count > 0
+    if changed and not options['dry_run']:
+        try:
+            save_conversation(path, graph.data, options['compact'])
+        except OSError as e:
+            return path, lines + [f"{path}: error: {e}"], True
+    return path, lines, False
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check and transform conversation files without the editor.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    def add_command(name, help_text):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("paths", nargs="+", help="conversation files or directories of them")
+        command.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+        if name not in ("validate", "search", "simulate", "bundle", "convert"): # They do not change the file
+            command.add_argument("-n", "--dry-run", action="store_true", help="report the changes without writing")
+        if name not in ("validate", "search", "simulate", "bundle"):
+            command.add_argument("--compact", action="store_true", help="write compact JSON instead of indented")
+        return command
+    validate = add_command("validate", "report links to missing nodes, unreachable nodes, dead ends and loops with no way out")
+    validate.add_argument("--root", default=ROOT_NODE_ID, help=f"node the conversation starts at (default: {ROOT_NODE_ID})")
+    validate.add_argument("--strict", action="store_true", help="fail on warnings too, not only on errors")
+    rename = add_command("rename", "rename nodes and rewrite the links to them")
+    rename.add_argument("--map", action="append", default=[], metavar="OLD=NEW", help="rename one node (repeatable)")
+    rename.add_argument("--regex", nargs=2, metavar=("PATTERN", "REPLACEMENT"), help="rename every node id the pattern matches")
+    prune = add_command("prune", "delete the nodes the start node does not lead to")
+    prune.add_argument("--root", default=ROOT_NODE_ID, help=f"node the conversation starts at (default: {ROOT_NODE_ID})")
+    layout = add_command("layout", "give nodes editor positions")
+    layout.add_argument("--mode", choices=("layered", "force"), default="layered")
+    layout.add_argument("--all", action="store_true", help="lay out every node, not only the ones without a position")
+    search = add_command("search", "list the nodes matching a query, best matches first (see SearchIndex)")
+    search.add_argument("-q", "--query", required=True, help="e.g. 'espresso', 'action == kill', 'has entry_mode'")
+    simulate = add_command("simulate", "play through the conversation like js/main.js and report coverage and 'killed' paths")
+    simulate.add_argument("--root", default=ROOT_NODE_ID, help=f"node the conversation starts at (default: {ROOT_NODE_ID})")
+    simulate.add_argument("--walks", type=int, default=10000, help="random walks to play (default: 10000)")
+    simulate.add_argument("--steps", type=int, default=SIM_WALK_STEPS, help=f"moves per walk at most (default: {SIM_WALK_STEPS})")
+    simulate.add_argument("--sessions", type=int, default=1, help="times a walk opens the dialog (default: 1)")
+    simulate.add_argument("--seed", type=int, help="seed of the random walks, for repeatable runs")
+    simulate.add_argument("--explore", action="store_true", help="visit every reachable state instead of walking at random")
+    simulate.add_argument("--max-states", type=int, default=SIM_MAX_STATES, help=f"stop exploring after this many states (default: {SIM_MAX_STATES})")
+    bundle = add_command("bundle", "write the minified runtime bundle js/main.js loads (with .gz/.br copies)")
+    bundle.add_argument("--root", default=ROOT_NODE_ID, help=f"node the conversation starts at (default: {ROOT_NODE_ID})")
+    bundle.add_argument("-o", "--output", help="bundle file (default: <file>.bundle.json next to the input, one input only)")
+    bundle.add_argument("--chunk-size", type=int, default=0, metavar="NODES", help="split into lazily fetched files of this many nodes")
+    bundle.add_argument("--no-compress", action="store_true", help="skip the .gz and .br copies")
+    convert = add_command("convert", "write a JSON file as a project, or a project as JSON (what js/main.js reads)")
+    convert.add_argument("-o", "--output", help=f"file to write (default: the input with .json and {PROJECT_SUFFIX} swapped, one input only)")
+    args = parser.parse_args(argv)
+
+    options = {'dry_run': getattr(args, 'dry_run', False), 'compact': getattr(args, 'compact', False),
+               'root': getattr(args, 'root', ROOT_NODE_ID), 'mode': getattr(args, 'mode', 'layered'),
+               'all': getattr(args, 'all', False), 'regex': getattr(args, 'regex', None), 'map': [],
+               'strict': getattr(args, 'strict', False), 'output': getattr(args, 'output', None),
+               'chunk_size': getattr(args, 'chunk_size', 0), 'no_compress': getattr(args, 'no_compress', False),
+               'query': getattr(args, 'query', None), 'explore': getattr(args, 'explore', False),
+               'walks': getattr(args, 'walks', 0), 'steps': getattr(args, 'steps', 0), 'sessions': getattr(args, 'sessions', 1),
+               'seed': getattr(args, 'seed', None), 'max_states': getattr(args, 'max_states', SIM_MAX_STATES), 'jobs': 1}
+    if options['chunk_size'] < 0: parser.error("--chunk-size must not be negative")
+    for item in getattr(args, 'map', []):
+        old, sep, new = item.partition("=")
+        if not sep: parser.error(f"--map expects OLD=NEW, got '{item}'")
+        options['map'].append((old, new))
+    if options['regex']:
+        try:
+            re.compile(options['regex'][0])
+        except re.error as e:
+            parser.error(f"invalid regular expression: {e}")
+    paths = list(dict.fromkeys(conversation_files(args.paths)))
+    if not paths: parser.error("no conversation files found")
+    if options['output'] and len(paths) > 1: parser.error("--output needs a single conversation file")
+    if len(paths) == 1: options['jobs'] = args.jobs # One file: the pool plays its walks instead
+
+    pool = None
+    commands_and_options = ([args.command] * len(paths), paths, [options] * len(paths))
+    if len(paths) > 1 and args.jobs != 1:
+        pool = ProcessPoolExecutor(max_workers=args.jobs)
+        results = pool.map(run_command, *commands_and_options,
+                           chunksize=max(1, len(paths) // (4 * (args.jobs or os.cpu_count() or 1))))
+    else:
+        results = map(run_command, *commands_and_options)
+    failed = 0
+    try:
+        for path, lines, path_failed in results: # In file order
+            for line in lines: print(line)
+            failed += path_failed
+    finally:
+        if pool is not None: pool.shutdown()
+    if len(paths) > 1:
+        print(f"{len(paths)} file(s), {failed} with problems")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
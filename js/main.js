@@ -22,7 +22,8 @@ const coffeeEntryArea = document.getElementById('coffee-entry-area');
 const coffeeTextInput = document.getElementById('coffee-text-input');
 const coffeeSubmitEntryBtn = document.getElementById('coffee-submit-entry-btn');
 
-let conversationData = null ;
+let conversationData = null ; // Node id -> node from conversation.json, node number -> node from a bundle
+let bundle = null; // Manifest of the runtime bundle (see conv_graph.py), null when conversation.json was loaded
 let currentNodeId = null;
 let currentItem = null;
 let entryAnswer = null;
@@ -30,14 +31,94 @@ let inventory = [];
 let sparing_numbers = 0;
 let killed = false;
 
+const BUNDLE_URL = "conversation.bundle.json";
+const BUNDLE_LINK_KEYS = ["next_node_id", "default_next_node_id"];
+
+function decodeBundleNode(node) {
+    // Numbers stand for strings of bundle.strings, except links: those are node numbers
+    for (const key in node) {
+        const value = node[key];
+        if (typeof value === "number" && !BUNDLE_LINK_KEYS.includes(key)) {
+            node[key] = bundle.strings[value];
+        } else if (value && typeof value === "object") {
+            decodeBundleNode(value); // Choices, secrets, entry_mode
+        }
+    }
+    return node;
+}
+
+function storeBundleNodes(first, nodes) {
+    nodes.forEach((node, i) => {
+        conversationData[first + i] = decodeBundleNode(node);
+    });
+}
+
+function loadChunk(chunk) {
+    // Fetches the chunk file once, later calls get the same promise
+    if (!bundle.loadedChunks[chunk]) {
+        bundle.loadedChunks[chunk] = fetch(bundle.chunks[chunk - 1])
+            .then(response => response.json())
+            .then(content => storeBundleNodes(content.first, content.nodes))
+            .catch(error => {
+                delete bundle.loadedChunks[chunk]; // Try again next time
+                throw error;
+            });
+    }
+    return bundle.loadedChunks[chunk];
+}
+
+function isLink(nodeId) {
+    // A node number can be 0 (the start node in a bundle): only null, undefined and "" are no link
+    return nodeId != null && nodeId !== "";
+}
+
+function resolveNodeId(nodeId) {
+    // Links in a bundle are node numbers already, the ids used by name below are looked up
+    if (bundle && typeof nodeId === "string") {
+        return nodeId in bundle.names ? bundle.names[nodeId] : null;
+    }
+    return nodeId;
+}
+
+function prefetchLinks(node) {
+    // Starts fetching the chunks the next nodes are in, so choosing one does not wait
+    if (!bundle || !bundle.chunk_size) return;
+    const links = (node.choices || []).map(choice => choice.next_node_id);
+    if (node.entry_mode) {
+        (node.entry_mode.secrets || []).forEach(secret => links.push(secret.next_node_id));
+        links.push(node.entry_mode.default_next_node_id);
+    }
+    links.forEach(link => {
+        if (typeof link === "number" && !conversationData[link]) {
+            loadChunk(Math.floor(link / bundle.chunk_size)).catch(() => {});
+        }
+    });
+}
+
 function displayNode (nodeId) {
 
     if (killed) { 
         nodeId = "killed";
     }
 
-    if (!conversationData || !conversationData[nodeId]) {
-        console.error(`Node "${nodeId}" not found in conversation data.`);
+    const requestedId = nodeId;
+    nodeId = resolveNodeId(nodeId);
+
+    if (bundle && bundle.chunk_size && typeof nodeId === "number" && nodeId < bundle.count && !conversationData[nodeId]) {
+        // In a chunk that is not here yet
+        loadChunk(Math.floor(nodeId / bundle.chunk_size))
+            .then(() => displayNode(nodeId))
+            .catch(error => {
+                console.error("Could not load conversation chunk:", error);
+                if (coffeeDialogText) {
+                    typewriterEffect(coffeeDialogText, "Hmm, I seem to have lost my train of thought...");
+                }
+            });
+        return;
+    }
+
+    if (!conversationData || nodeId === null || !conversationData[nodeId]) {
+        console.error(`Node "${requestedId}" not found in conversation data.`);
         if (coffeeDialogText) {
             typewriterEffect(coffeeDialogText, "Hmm, I seem to have lost my train of thought...");
         }
@@ -46,6 +127,7 @@ function displayNode (nodeId) {
 
     currentNodeId = nodeId;
     const node = conversationData[nodeId];
+    prefetchLinks(node);
     
     if (killed) {
         coffeeSprite.src = "";
@@ -105,7 +187,7 @@ function displayNode (nodeId) {
 }
 
 function handleEntrySubmit() {
-    if (!conversationData || !currentNodeId || !conversationData[currentNodeId] || !conversationData[currentNodeId].entry_mode) {
+    if (!conversationData || currentNodeId === null || !conversationData[currentNodeId] || !conversationData[currentNodeId].entry_mode) {
         console.error("Cannot handle entry: current node is not an entry node or data missing.");
         return;
     }
@@ -129,7 +211,7 @@ function handleEntrySubmit() {
     }
 
     if (!navigated) {
-        if (entryConfig.default_next_node_id) {
+        if (isLink(entryConfig.default_next_node_id)) {
             displayNode(entryConfig.default_next_node_id);
         } else {
             // Optional: Re-display current prompt or show a generic "try again" message
@@ -224,7 +306,7 @@ function handleChoice (choice)  {
         
     }
 
-    if (choice.next_node_id && currentNodeId != null) {
+    if (isLink(choice.next_node_id) && currentNodeId != null) {
         displayNode(choice.next_node_id);
     }
     else {
@@ -242,9 +324,18 @@ function startConversation() {
 
 async function loadConversation () {
     try {
-        const response = await fetch("conversation.json");
-        
-        conversationData = await response.json();
+        // The runtime bundle when it was exported, conversation.json as it is otherwise
+        let response = await fetch(BUNDLE_URL);
+        if (response.ok) {
+            bundle = await response.json();
+            bundle.loadedChunks = {0: Promise.resolve()};
+            conversationData = new Array(bundle.count);
+            storeBundleNodes(0, bundle.nodes);
+            bundle.nodes = null;
+        } else {
+            response = await fetch("conversation.json");
+            conversationData = await response.json();
+        }
         
     } catch (error)  {
          console.error("Could not load conversation data:", error);
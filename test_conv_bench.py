@@ -0,0 +1,34 @@
+# Tests of the benchmark runner, run with: python -m pytest -q
+import pytest
+
+import conv_bench as b
+import conv_graph as g
+
+def has_display():
+    try:
+        import tkinter
+        tkinter.Tk().destroy()
+    except Exception: # No tkinter or no display (TclError)
+        return False
+    return True
+
+def test_generated_conversation_has_no_dangling_links():
+    data = b.generate_conversation(200, seed=3)
+    assert len(data) == 200 and g.ROOT_NODE_ID in data
+    assert [issue for issue in g.node_issues_all(data) if issue[0] == g.ISSUE_ERROR] == []
+    assert data == b.generate_conversation(200, seed=3)
+
+def test_compare_flags_regressions_beyond_the_threshold():
+    def results(**medians):
+        return {'results': {name: {'median': median} for name, median in medians.items()}}
+    rows = b.compare_results(results(load=1.0, draw=0.5, zoom=0.001), results(load=1.3, draw=0.4, zoom=0.002, save=0.2))
+    assert [(name, status) for name, _, _, status in rows] == [
+        ("load", "regression"), ("draw", "improvement"), ("zoom", "same"), ("save", "new")]
+
+@pytest.mark.skipif(not has_display(), reason="needs a display (run under xvfb-run)")
+def test_every_scenario_runs_on_a_tiny_graph():
+    lines = []
+    results = b.run_benchmarks({'nodes': 30, 'seed': 1}, list(b.SCENARIOS), 1, progress=lines.append)
+    assert list(results['results']) == list(b.SCENARIOS) and len(lines) == len(b.SCENARIOS)
+    assert all(len(result['samples']) == 1 and result['min'] >= 0 for result in results['results'].values())
+    assert {status for *_, status in b.compare_results(results, results)} == {"same"}
@@ -0,0 +1,264 @@
+# Tests of the headless model, run with: python -m pytest -q
+import copy
+import json
+import marshal
+import os
+
+import pytest
+
+import conv_graph as g
+
+SHIPPED = json.load(open(os.path.join(os.path.dirname(__file__), "conversation.json"), encoding="utf-8"))
+
+def node(*targets, action=None, text="..."):
+    # A node with one choice per target ("" for a choice without a link)
+    choices = [{"text": f"go {t}", "next_node_id": t} for t in targets]
+    if action: choices.append({"text": action, "action": action})
+    return {"sprite_text": text, "sprite_image": "", "choices": choices}
+
+# --- Reachability: prune and validate follow the same links ---
+def unreachable(data):
+    return {node_id for _, kind, node_id, _ in g.graph_issues(data) if kind == "unreachable"}
+
+def test_prune_keeps_nodes_reached_through_actions():
+    data = {"start": node("a", action="check_latte"), "a": node(action="kill"),
+            "give": node(), "give_failed": node(), "killed": node(), "orphan": node("start")}
+    graph = g.ConversationGraph(data)
+    assert graph.reachable() == {"start", "a", "give", "give_failed", "killed"}
+    assert graph.prune() == ["orphan"]
+    assert set(data) == {"start", "a", "give", "give_failed", "killed"}
+
+def test_prune_agrees_with_validate_on_shipped_file():
+    data = copy.deepcopy(SHIPPED)
+    graph = g.ConversationGraph(data)
+    removed = graph.prune()
+    assert set(removed) == unreachable(SHIPPED)
+    assert {"give", "give_failed", "killed", "spare_success"} <= set(data)
+
+def test_reachable_follows_secrets_and_default_of_entry_mode():
+    data = {"start": {"sprite_text": "code?", "entry_mode": {
+                "secrets": [{"input": "42", "next_node_id": "right"}], "default_next_node_id": "wrong"}},
+            "right": node(), "wrong": node()}
+    assert g.ConversationGraph(data).reachable() == {"start", "right", "wrong"}
+
+# --- Journal ---
+@pytest.fixture
+def conv_file(tmp_path):
+    path = str(tmp_path / "c.json")
+    g.save_conversation(path, {"start": node("a"), "a": node()})
+    return path
+
+def test_journal_replays_records(conv_file):
+    journal = g.ChangeJournal(conv_file)
+    journal.open()
+    journal.append({"op": "set", "node": "a", "path": "sprite_text", "value": "hi"})
+    journal.append_many([{"op": "add", "node": "b", "data": node()}, {"op": "rename", "node": "a", "to": "c"}])
+    journal.close()
+    base, records = g.read_journal(journal.path)
+    assert base["file"] == "c.json" and len(records) == 3
+    data = g.load_conversation(conv_file)
+    for record in records: g.apply_journal_record(data, record)
+    assert data["c"]["sprite_text"] == "hi" and "b" in data
+    assert data["start"]["choices"][0]["next_node_id"] == "c"
+
+def test_journal_after_torn_write_keeps_later_records(conv_file):
+    journal = g.ChangeJournal(conv_file)
+    journal.open()
+    journal.append({"op": "set", "node": "a", "path": "sprite_text", "value": "1"})
+    journal.file.write(b'{"op": "set", "node": "a", "pa') # Crash in the middle of a line
+    journal.close()
+    journal.open()
+    journal.append({"op": "set", "node": "a", "path": "sprite_text", "value": "2"})
+    journal.append({"op": "set", "node": "a", "path": "sprite_text", "value": "3"})
+    journal.close()
+    assert [record["value"] for record in g.read_journal(journal.path)[1]] == ["1", "2", "3"]
+
+def test_journal_reset_rebases_onto_current_file(conv_file):
+    journal = g.ChangeJournal(conv_file)
+    journal.open()
+    record = {"op": "set", "node": "a", "path": "sprite_text", "value": "kept"}
+    journal.append(record)
+    journal.file.write(b'{"torn')
+    journal.close()
+    g.save_conversation(conv_file, {"start": node("a"), "a": node(), "new": node()}) # Modified after the records
+    journal.reset(g.read_journal(journal.path)[1])
+    base, records = g.read_journal(journal.path)
+    st = os.stat(conv_file)
+    assert (base["size"], base["mtime"]) == (st.st_size, st.st_mtime)
+    assert records == [record]
+    assert open(journal.path, 'rb').read().endswith(b"\n")
+
+def test_journal_rebase_keeps_records_after_offset(conv_file):
+    journal = g.ChangeJournal(conv_file)
+    journal.open()
+    journal.append({"op": "set", "node": "a", "path": "sprite_text", "value": "saved"})
+    offset = journal.size()
+    journal.append({"op": "set", "node": "a", "path": "sprite_text", "value": "later"})
+    other = conv_file.replace("c.json", "d.json")
+    g.save_conversation(other, {"start": node("a"), "a": node()})
+    journal.rebase(offset, other)
+    journal.close()
+    assert not os.path.exists(conv_file + g.JOURNAL_SUFFIX)
+    base, records = g.read_journal(other + g.JOURNAL_SUFFIX)
+    assert base["file"] == "d.json" and [record["value"] for record in records] == ["later"]
+
+# --- Runtime bundle ---
+def decode_bundle(manifest, chunks, ids):
+    # What js/main.js does with a bundle, then node numbers back to ids (ids[number])
+    def decode(value, key):
+        if isinstance(value, dict): return {k: decode(v, k) for k, v in value.items()}
+        if isinstance(value, list): return [decode(v, key) for v in value]
+        if isinstance(value, int) and key in g.BUNDLE_LINK_KEYS: return ids[value]
+        if isinstance(value, int): return manifest["strings"][value]
+        return value
+    nodes = manifest["nodes"] + [node_data for chunk in chunks for node_data in chunk]
+    assert len(nodes) == manifest["count"]
+    return {ids[i]: decode(node_data, None) for i, node_data in enumerate(nodes)}
+
+def test_bundle_link_back_to_root_is_node_zero():
+    data = {"start": node("a"), "a": node("start", "b"), "b": {"sprite_text": "?", "entry_mode": {
+                "secrets": [{"input": "x", "next_node_id": "a"}], "default_next_node_id": "start"}}}
+    manifest, chunks = g.encode_runtime_bundle(data)
+    assert manifest["root"] == manifest["names"]["start"] == 0 and chunks == []
+    a, b = manifest["nodes"][1], manifest["nodes"][2]
+    assert a["choices"][0]["next_node_id"] == 0
+    assert b["entry_mode"]["default_next_node_id"] == 0
+    assert decode_bundle(manifest, chunks, g.runtime_order(data)) == data
+
+@pytest.mark.parametrize("chunk_size", [0, 7])
+def test_bundle_round_trip(chunk_size):
+    data = copy.deepcopy(SHIPPED)
+    data["deep_talk"]["choices"][0]["next_node_id"] = "start" # A link back to the root
+    manifest, chunks = g.encode_runtime_bundle(data, chunk_size=chunk_size)
+    expected = {node_id: {k: v for k, v in node_data.items() if k not in g.BUNDLE_EDITOR_KEYS}
+                for node_id, node_data in data.items()}
+    assert decode_bundle(manifest, chunks, g.runtime_order(data)) == expected
+
+# --- Simulation ---
+def kill_report_lines(data, stats):
+    return [(node_id, text) for node_id, text in g.simulation_report(data, stats) if text.startswith("Reaches 'killed'")]
+
+@pytest.mark.parametrize("kill_link", ["", "after"])
+def test_simulation_reports_the_node_the_kill_happened_at(kill_link):
+    # Without a link the kill leaves the player at "fight", so the path ends there
+    data = {"start": node("fight"), "after": node(), "killed": node(action="end_conversation"),
+            "fight": {"sprite_text": "...", "choices": [{"text": "kill", "action": "kill", "next_node_id": kill_link}]}}
+    for stats in (g.explore_states(data), g.random_walks(data, 50, 20, seed=1)):
+        lines = kill_report_lines(data, stats)
+        assert lines and all(node_id == "fight" for node_id, _ in lines)
+
+def test_explore_states_finds_every_ending():
+    data = {"start": node("shop", action="end_conversation"),
+            "shop": node("start", action="save_latte"), "pay": node(action="check_latte"),
+            "give": node(action="end_conversation"), "give_failed": node("start")}
+    data["shop"]["choices"].append({"text": "pay", "next_node_id": "pay"})
+    stats = g.explore_states(data, reopen=False)
+    assert set(stats['visits']) == set(data)
+    assert stats['actions']['check_latte'] and stats['endings']['closed']
+    assert not stats['missing'] and not stats['truncated']
+
+def test_simulate_walks_is_repeatable_with_a_seed():
+    one = g.simulate_walks(SHIPPED, 300, 50, seed=7, jobs=1)
+    again = g.simulate_walks(SHIPPED, 300, 50, seed=7, jobs=1)
+    assert one['steps'] == again['steps'] and one['endings'] == again['endings']
+    assert one['walks'] == 300 and one['killed_paths'] == again['killed_paths']
+
+# --- Graph edits ---
+def test_rename_and_remove_rewrite_links():
+    data = {"start": node("a", "b"), "a": node("a"), "b": node("a")}
+    graph = g.ConversationGraph(data)
+    assert graph.rename_node("a", "x") == {"start", "x", "b"}
+    assert [t for _, t in g.iter_node_links(data["start"])] == ["x", "b"]
+    assert data["x"]["choices"][0]["next_node_id"] == "x" # Self link
+    assert graph.bulk_rename({"x": "b", "b": "x"}) is None # A swap goes through temporary ids
+    assert [t for _, t in g.iter_node_links(data["start"])] == ["b", "x"]
+    assert graph.remove_node("b") == {"start", "x"}
+    assert [choice["next_node_id"] for choice in data["start"]["choices"]] == ["", "x"]
+    assert graph.bulk_rename({"x": "start"}) == "Node ID 'start' already exists."
+
+def test_copy_subgraph_remaps_internal_links():
+    nodes = {"a": node("b", "out"), "b": node("a")}
+    copies = g.copy_subgraph(nodes, {"a", "b", "out", "a_copy"})
+    assert list(copies) == ["a_copy2", "b_copy"]
+    assert [t for _, t in g.iter_node_links(copies["a_copy2"])] == ["b_copy", "out"]
+    assert nodes["a"]["choices"][0]["next_node_id"] == "b" # The originals are untouched
+
+# --- JSON and projects ---
+def normalized(data):
+    return json.loads(json.dumps(data)) # editor_pos tuples become lists like in a file
+
+def test_json_and_project_round_trip(tmp_path):
+    json_path, project_path = str(tmp_path / "c.json"), str(tmp_path / "c.convdb")
+    g.save_conversation(json_path, SHIPPED)
+    g.save_conversation(project_path, g.load_conversation(json_path))
+    back = g.load_conversation(project_path)
+    assert normalized(back) == normalized(SHIPPED) and list(back) == list(SHIPPED)
+
+def test_write_conversation_file_takes_fragments_and_marshalled_nodes(tmp_path):
+    path = str(tmp_path / "c.json")
+    nodes = [(node_id, json.dumps(node_data, indent=2, ensure_ascii=False).replace("\n", "\n  ") if i % 3 == 0 else
+              marshal.dumps(node_data) if i % 3 == 1 else node_data) for i, (node_id, node_data) in enumerate(SHIPPED.items())]
+    encoded = {}
+    g.write_conversation_file(path, nodes, encoded, False, lambda message: None)
+    assert open(path, encoding="utf-8").read() == json.dumps(SHIPPED, indent=2, ensure_ascii=False)
+    assert set(encoded) == {node_id for i, node_id in enumerate(SHIPPED) if i % 3}
+
+def test_convert_command_both_ways(tmp_path, capsys):
+    json_path = str(tmp_path / "c.json")
+    g.save_conversation(json_path, SHIPPED)
+    assert g.main(["convert", json_path]) == 0
+    assert g.main(["convert", str(tmp_path / "c.convdb"), "-o", str(tmp_path / "back.json")]) == 0
+    assert normalized(g.load_conversation(str(tmp_path / "back.json"))) == normalized(SHIPPED)
+    assert "wrote" in capsys.readouterr().out
+
+def test_project_store_matches_journal_replay(tmp_path):
+    path = str(tmp_path / "c.convdb")
+    data = copy.deepcopy(SHIPPED)
+    g.save_conversation(path, data)
+    records = [{"op": "set", "node": "start", "path": "sprite_text", "value": "hello"},
+               {"op": "move", "node": "farewell", "pos": [1.5, 2.5]},
+               {"op": "rename", "node": "ask_type", "to": "ask_kind"},
+               {"op": "delete", "node": "too_expensive"},
+               {"op": "add", "node": "new", "data": node("ask_kind")},
+               {"op": "node", "node": "payment", "data": node("new")}]
+    store = g.ProjectStore(path)
+    store.open()
+    store.append(records[0])
+    store.append_many(records[1:])
+    store.close()
+    for record in copy.deepcopy(records): g.apply_journal_record(data, record)
+    assert normalized(g.load_conversation(path)) == normalized(data)
+
+def test_project_store_rebase_replays_later_records(tmp_path):
+    path, other = str(tmp_path / "c.convdb"), str(tmp_path / "d.convdb")
+    g.save_conversation(path, {"start": node("a"), "a": node()})
+    store = g.ProjectStore(path)
+    store.open()
+    store.append({"op": "set", "node": "a", "path": "sprite_text", "value": "saved"})
+    offset = store.size()
+    snapshot = g.load_conversation(path) # What a save as other writes
+    store.append({"op": "set", "node": "a", "path": "sprite_text", "value": "later"})
+    g.save_conversation(other, snapshot)
+    store.rebase(offset, other)
+    store.close()
+    assert g.load_conversation(other)["a"]["sprite_text"] == "later"
+    assert store.size() == 0
+
+# --- Command line ---
+def test_prune_and_validate_commands_agree(tmp_path, capsys):
+    path = str(tmp_path / "c.json")
+    g.save_conversation(path, dict(SHIPPED, orphan=node("start")))
+    g.main(["validate", path])
+    assert [line for line in capsys.readouterr().out.splitlines() if "Not reachable" in line] == [
+        f"{path}: warning: orphan: Not reachable from 'start'"]
+    assert g.main(["prune", "-n", path]) == 0
+    assert capsys.readouterr().out.splitlines() == [f"{path}: removed orphan", f"{path}: removed 1 unreachable node(s)"]
+    assert "orphan" in g.load_conversation(path) # Dry run
+    assert g.main(["prune", path]) == 0
+    assert normalized(g.load_conversation(path)) == normalized(SHIPPED)
+
+def test_validate_command_fails_on_missing_node(tmp_path, capsys):
+    path = str(tmp_path / "c.json")
+    g.save_conversation(path, {"start": node("gone")})
+    assert g.main(["validate", path]) == 1
+    assert f"{path}: error: start: 'choices.0.next_node_id' points to missing node 'gone'" in capsys.readouterr().out